@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+import black_scholes
+from utils import normal
+from utils.option import Call, Put, OptionArray
+from utils.book import book_from_columns
+from utils.data_handling import extract_option_params, fetch_data_from_excel, fetch_data_from_pickle, \
+                                consolidate_call_put_into_dataframe, generate_spot_interval
+
+MAIN_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+SIZES = (1, 10**3, 10**6)
+
+def best_of(func, repeat: int = 5) -> float:
+    number = max(1, int(0.2 / max(timeit.timeit(func, number = 1), 1e-7)))
+    return min(timeit.repeat(func, number = number, repeat = repeat)) / number
+
+def normal_accuracy() -> None:
+    x = np.linspace(-40, 40, 2_000_001)
+    for name, ours, theirs in (("cdf", normal.cdf, norm.cdf), ("pdf", normal.pdf, norm.pdf)):
+        a, b = ours(x), theirs(x)
+        absolute = np.max(np.abs(a - b))
+        relative = np.max(np.abs(a - b)[b > 0] / b[b > 0])
+        print("{:}: max abs err = {:.3e}, max rel err = {:.3e}".format(name, absolute, relative))
+
+def normal_speed() -> None:
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>5} {:>14} {:>14} {:>9}".format("size", "fn", "scipy.stats", "utils.normal", "speedup"))
+    for size in SIZES:
+        x = 0.3 if size == 1 else rng.standard_normal(size)
+        for name, ours, theirs in (("cdf", normal.cdf, norm.cdf), ("pdf", normal.pdf, norm.pdf)):
+            t_theirs = best_of(lambda: theirs(x))
+            t_ours = best_of(lambda: ours(x))
+            print("{:>10} {:>5} {:>12.2f}us {:>12.2f}us {:>8.1f}x".format(size, name, 1e6 * t_theirs, 1e6 * t_ours, t_theirs / t_ours))
+
+def spot_ticks(ticks: int = 20000, book_size: int = 10**5) -> None:
+    """
+    Ticks per second when only the spot moves: recomputing every term
+    (setting T each tick invalidates the cache, as before) against
+    reusing the cached spot independent terms.
+    """
+    rng = np.random.default_rng(0)
+    spots = 100 * np.exp(np.cumsum(rng.normal(0, 1e-4, ticks)))
+
+    def scalar(invalidate: bool) -> float:
+        c = Call(S = 100.0, K = 105.0, T = 0.25, v = 0.2, r = 0.05, q = 0.01)
+        start = timeit.default_timer()
+        for S in spots:
+            if invalidate:
+                c.T = 0.25
+            c.update_spot(S)
+            c.delta(), c.gamma()
+        return ticks / (timeit.default_timer() - start)
+
+    o = black_scholes.option( rng.uniform(50, 150, book_size), rng.uniform(50, 150, book_size) \
+                            , rng.uniform(0.05, 2, book_size), rng.uniform(0.1, 0.6, book_size) \
+                            , rng.uniform(0, 0.1, book_size), rng.uniform(0, 0.05, book_size)   )
+    terms = black_scholes.spot_independent_terms(o)
+    which = ("delta", "gamma")
+
+    def full():
+        black_scholes.greeks(o, which)
+    def cached():
+        black_scholes.greeks_at_spot(terms, o.S, which)
+
+    print("scalar Call ticks/s: full {:,.0f}, cached {:,.0f}".format(scalar(True), scalar(False)))
+    print("book of {:,} ticks/s: full {:,.1f}, cached {:,.1f}".format(book_size, 1 / best_of(full), 1 / best_of(cached)))
+
+# modules a headless run must not import
+HEAVY_MODULES = ("matplotlib", "seaborn", "scipy.stats", "numba")
+STARTUP_BUDGET_MS = 1500
+
+def import_times(statement: str) -> dict:
+    """
+    Cumulative import time in microseconds per module, parsed from
+    `python -X importtime`.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], 
+                               cwd = os.path.dirname(os.path.abspath(__file__)), 
+                               capture_output = True, text = True, check = True)
+    times = dict()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def startup(budget_ms: float = STARTUP_BUDGET_MS, top: int = 10) -> bool:
+    times = import_times("import main")
+    total = times["main"] / 1000
+
+    print("import main: {:.0f}ms (budget {:.0f}ms)".format(total, budget_ms))
+    for name, cumulative in sorted(times.items(), key = lambda x: -x[1])[1:top + 1]:
+        print("{:>10.1f}ms  {:}".format(cumulative / 1000, name))
+
+    heavy = sorted(x for x in times if any(x == h or x.startswith(h + ".") for h in HEAVY_MODULES))
+    if heavy:
+        print("FAIL: heavy modules imported at startup: {:}".format(", ".join(heavy[:5])))
+
+    if total > budget_ms:
+        print("FAIL: startup over budget")
+
+    return not heavy and total <= budget_ms
+
+KERNEL_SIZES = (1, 10**3, 10**5, 10**7)
+REGRESSION_THRESHOLD = 0.10
+
+def synthetic_book(size: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random book with the must_have_columns layout of data/plan_base.xlsx.
+    """
+    rng = np.random.default_rng(seed)
+    underlyings = np.array(["USD/MXN", "USD/BRL", "EUR/USD", "USD/JPY", "GBP/USD"])
+    spots = np.array([20.0, 5.0, 1.1, 150.0, 1.25])
+    codes = rng.integers(0, len(underlyings), size)
+    spot = spots[codes] * rng.uniform(0.95, 1.05, size)
+
+    return pd.DataFrame({ "ativo"     : underlyings[codes]                                    \
+                        , "call_put"  : np.where(rng.random(size) < 0.5, "Call", "Put")       \
+                        , "direction" : np.where(rng.random(size) < 0.5, "Buy", "Sell")       \
+                        , "tenor"     : rng.integers(1, 720, size)                            \
+                        , "spot"      : spot                                                  \
+                        , "strike"    : spot * rng.uniform(0.8, 1.2, size)                    \
+                        , "forward"   : spot                                                  \
+                        , "notional"  : rng.integers(1, 100, size) * 1e6                      \
+                        , "vol"       : rng.uniform(0.05, 0.5, size)                          \
+                        , "r_d"       : rng.uniform(0.0, 0.1, size)                           \
+                        , "r_f"       : rng.uniform(0.0, 0.05, size)                          })
+
+def synthetic_option(size: int, seed: int = 0) -> black_scholes.option:
+    return book_from_columns(synthetic_book(size, seed))
+
+def timed(results: dict, name: str, func, repeat: int = 5) -> None:
+    results[name] = best_of(func, repeat)
+    print("{:<48} {:>14.6f}s".format(name, results[name]))
+
+def kernel_suite(results: dict, max_size: int) -> None:
+    names = ("price", "delta", "gamma", "theta", "vega", "rho")
+    for size in (x for x in KERNEL_SIZES if x <= max_size):
+        o = synthetic_option(size)
+        repeat = 5 if size < 10**6 else 2
+        timed(results, "black_scholes.greeks[{:}]".format(size), lambda: black_scholes.greeks(o), repeat)
+        for leg in ("call", "put"):
+            for name in names:
+                kernel = getattr(black_scholes, "{:}_{:}".format(leg, name))
+                timed(results, "black_scholes.{:}_{:}[{:}]".format(leg, name, size), lambda: kernel(o), repeat)
+
+        array = OptionArray.from_book(o)
+        timed(results, "utils.option.OptionArray.greek_values[{:}]".format(size), array.greek_values, repeat)
+        for cls in (Call, Put):
+            scalar = cls(**{k: getattr(o, k) for k in OptionArray.FIELDS})
+            for name in names:
+                def fresh(method = getattr(cls, name)):
+                    scalar.S = o.S
+                    return method(scalar)
+                timed(results, "utils.option.{:}.{:}[{:}]".format(cls.__name__, name, size), fresh, repeat)
+
+def io_suite(results: dict, book_size: int) -> None:
+    data = synthetic_book(book_size)
+    with tempfile.TemporaryDirectory() as directory:
+        xlsx_file = os.path.join(directory, "book.xlsx")
+        pickle_file = os.path.join(directory, "book.pickle")
+        data.to_excel(xlsx_file, index = False)
+        data.to_pickle(pickle_file)
+
+        timed(results, "fetch_data_from_excel[{:}]".format(book_size), lambda: fetch_data_from_excel(xlsx_file), 1)
+        timed(results, "fetch_data_from_pickle[{:}]".format(book_size), lambda: fetch_data_from_pickle(pickle_file))
+
+        calls, puts = fetch_data_from_pickle(pickle_file)
+        timed(results, "extract_option_params[{:}]".format(book_size), lambda: extract_option_params(calls))
+        timed(results, "book_from_columns[{:}]".format(book_size), lambda: book_from_columns(data))
+
+        percentuals = np.array([-10, -7, -5, -2, -1, 0, 1, 2, 5, 7, 10]) / 100
+        call_options, call_notionals, call_names = extract_option_params(calls)
+        put_options, put_notionals, put_names = extract_option_params(puts)
+        call_options.S = generate_spot_interval(call_options.S, percentuals)
+        put_options.S = generate_spot_interval(put_options.S, percentuals)
+        call_deltas = black_scholes.call_dollar_delta(call_notionals, call_options)
+        put_deltas = black_scholes.put_dollar_delta(put_notionals, put_options)
+        columns = ["Delta {:}%".format(int(100 * x)) for x in percentuals]
+
+        timed(results, "consolidate_call_put_into_dataframe[{:}]".format(book_size), 
+              lambda: consolidate_call_put_into_dataframe(call_deltas, call_names, put_deltas, put_names, columns))
+
+def plot_suite(results: dict, book_size: int) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import utils.tables
+
+    rng = np.random.default_rng(0)
+    rows = min(book_size, utils.tables.MAX_ROWS)
+    table = pd.DataFrame(rng.normal(size = (rows, 11)) * 1e6, 
+                         index = ["USD/MXN-Call-Buy"] * rows, columns = ["Delta {:}%".format(x) for x in range(11)])
+    table.name = "table_delta"
+    big = pd.DataFrame(rng.normal(size = (book_size, 11)) * 1e6, 
+                       index = synthetic_book(book_size).ativo + "-Call-Buy", columns = table.columns)
+
+    with tempfile.TemporaryDirectory() as directory:
+        def seaborn_heatmap():
+            utils.tables.save_table_heatmap(utils.tables.plot_table(table), os.path.join(directory, "a.png"))
+            plt.close("all")
+        timed(results, "utils.tables.plot_table[{:}]".format(rows), seaborn_heatmap, 1)
+        timed(results, "utils.tables.render_table[{:}]".format(book_size), 
+              lambda: utils.tables.render_table(big, os.path.join(directory, "b.png")), 1)
+
+def end_to_end_suite(results: dict, book_size: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        xlsx_file = os.path.join(directory, "book.xlsx")
+        synthetic_book(book_size).to_excel(xlsx_file, index = False)
+
+        def run():
+            # outputs go to the temporary directory, never to the repository's data/
+            subprocess.run([sys.executable, os.path.join(MAIN_DIRECTORY, "main.py"), xlsx_file, "--no-cache", 
+                            "--no-plot", "--output-dir", directory], 
+                           check = True, capture_output = True)
+        timed(results, "main.py[{:}]".format(book_size), run, 1)
+
+def precision_errors(book, percentuals: np.ndarray) -> None:
+    """
+    float32 against float64 greeks over the spot ladder: max absolute
+    error, max relative error (on cells above 1e-6 of the greek's largest
+    magnitude) and the heatmap cells whose whole-unit rounding changes.
+    """
+    book.S = generate_spot_interval(book.S, percentuals)
+    exact = black_scholes.greeks(book, black_scholes.GREEKS, book.notional, book.is_call)
+    single = black_scholes.greeks(book, black_scholes.GREEKS, book.notional, book.is_call, precision = "float32")
+
+    print("{:<14} {:>14} {:>14} {:>16}".format("greek", "max abs", "max rel", "rounded cells"))
+    for name, reference in exact.items():
+        error = np.abs(single[name] - reference)
+        significant = np.abs(reference) > 1e-6 * np.abs(reference).max()
+        relative = (error[significant] / np.abs(reference[significant])).max() if significant.any() else 0.0
+        changed = np.count_nonzero(np.round(single[name].astype(np.float64)) != np.round(reference))
+        print("{:<14} {:>14.3e} {:>14.3e} {:>9,}/{:<9,}".format(name, error.max(), relative, changed, reference.size))
+
+def precision_suite(results: dict, book_size: int) -> None:
+    percentuals = np.array([-10, -7, -5, -2, -1, 0, 1, 2, 5, 7, 10]) / 100
+
+    print("float32 vs float64, data/plan_base.xlsx")
+    precision_errors(book_from_columns(pd.read_excel(os.path.join(MAIN_DIRECTORY, "data", "plan_base.xlsx"))), percentuals)
+    print("float32 vs float64, synthetic book of {:}".format(book_size))
+    precision_errors(synthetic_option(book_size), percentuals)
+
+    book = synthetic_option(book_size)
+    book.S = generate_spot_interval(book.S, percentuals)
+    for precision in black_scholes.PRECISIONS:
+        timed(results, "black_scholes.greeks[{:},{:}]".format(book_size, precision), 
+              lambda: black_scholes.greeks(book, ("delta", "gamma"), book.notional, book.is_call, precision = precision))
+
+def proxy_suite(results: dict, book_size: int, scenarios: int = 10**6) -> None:
+    from utils.proxy import taylor_proxy, proxy_error
+
+    book = synthetic_option(book_size)
+    rng = np.random.default_rng(0)
+    shocks = {"spot": rng.normal(0, 0.01, scenarios), "vol": rng.normal(0, 0.005, scenarios), "time": 1.0}
+    per_underlying = dict(shocks, spot = rng.normal(0, 0.01, (scenarios, len(book.names))))
+
+    timed(results, "utils.proxy.taylor_proxy[{:}]".format(book_size), lambda: taylor_proxy(book))
+    proxy = taylor_proxy(book)
+    timed(results, "utils.proxy.pnl[{:},book]".format(scenarios), lambda: proxy.pnl(shocks))
+    timed(results, "utils.proxy.pnl[{:},underlying]".format(scenarios), 
+          lambda: proxy.pnl(per_underlying, by = "underlying"))
+    print("{:,.0f} scenarios/s on the book".format(scenarios / results["utils.proxy.pnl[{:},book]".format(scenarios)]))
+
+    error = proxy_error(proxy, book, shocks, sample_size = 64)
+    print("proxy error on 64 revalued scenarios: max abs {:.3e}, rms {:.3e}, max rel {:.2e}".format(
+          error.max_abs, error.rms, error.max_rel))
+
+def git_revision() -> str:
+    completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = MAIN_DIRECTORY, 
+                               capture_output = True, text = True)
+    return completed.stdout.strip() or "unknown"
+
+def compare(results: dict, baseline_file: str, threshold: float) -> bool:
+    """
+    Flags every timing more than `threshold` slower than the baseline run.
+    """
+    with open(baseline_file) as handle:
+        baseline = json.load(handle)
+
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline["results"].get(name)
+        if before and seconds > before * (1 + threshold):
+            regressions.append((name, before, seconds))
+
+    print("compared with {:} ({:})".format(baseline_file, baseline.get("revision")))
+    for name, before, seconds in regressions:
+        print("REGRESSION: {:} {:.6f}s -> {:.6f}s (+{:.0f}%)".format(name, before, seconds, 100 * (seconds / before - 1)))
+
+    return not regressions
+
+SECTIONS = ("normal", "startup", "ticks", "kernels", "io", "plot", "e2e", "precision", "proxy")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Benchmarks")
+    parser.add_argument("sections", nargs = "*", choices = SECTIONS, default = list(SECTIONS))
+    parser.add_argument("--startup-budget-ms", type = float, default = STARTUP_BUDGET_MS)
+    parser.add_argument("--max-size", type = int, default = KERNEL_SIZES[-1], 
+                        help = "largest array size for the kernel timings")
+    parser.add_argument("--book-size", type = int, default = 10**4, 
+                        help = "rows of the synthetic book for the io, plot, e2e and precision runs")
+    parser.add_argument("--output", default = None, help = "JSON file for the timings")
+    parser.add_argument("--compare", default = None, help = "JSON file of a previous run")
+    parser.add_argument("--threshold", type = float, default = REGRESSION_THRESHOLD, 
+                        help = "relative slowdown reported as a regression")
+    arguments = parser.parse_args()
+
+    passed = True
+    results = dict()
+    if "kernels" in arguments.sections:
+        kernel_suite(results, arguments.max_size)
+    if "io" in arguments.sections:
+        io_suite(results, arguments.book_size)
+    if "plot" in arguments.sections:
+        plot_suite(results, arguments.book_size)
+    if "e2e" in arguments.sections:
+        end_to_end_suite(results, arguments.book_size)
+    if "precision" in arguments.sections:
+        precision_suite(results, arguments.book_size)
+    if "proxy" in arguments.sections:
+        proxy_suite(results, arguments.book_size)
+
+    if results:
+        output = arguments.output or os.path.join(MAIN_DIRECTORY, "bench_results", git_revision() + ".json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+        with open(output, "w") as handle:
+            json.dump({"revision": git_revision(), "timestamp": time.time(), "results": results}, handle, indent = 1)
+        print("timings written to {:}".format(output))
+
+    if results and arguments.compare:
+        passed = compare(results, arguments.compare, arguments.threshold) and passed
+
+    if "normal" in arguments.sections:
+        normal_accuracy()
+        normal_speed()
+    if "ticks" in arguments.sections:
+        spot_ticks()
+    if "startup" in arguments.sections:
+        passed = startup(arguments.startup_budget_ms) and passed
+
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__": main()
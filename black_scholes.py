@@ -1,7 +1,10 @@
-from dataclasses import dataclass
+import functools
+from dataclasses import dataclass, replace
 
 import numpy as np
-from scipy.stats import norm
+from utils import normal, backends
+
+PRECISIONS = ("float64", "float32")
 
 @dataclass
 class option:
@@ -12,9 +15,24 @@ class option:
     r: np.ndarray
     q: np.ndarray
 
+    @property
+    def dtype(self) -> np.dtype:
+        return np.result_type(self.S, self.K, self.T, self.v, self.r, self.q)
+
+    def astype(self, dtype) -> "option":
+        """
+        Copy with S, K, T, v, r and q stored as `dtype` ("float64" or
+        "float32"); other fields of subclasses are kept as they are.
+        """
+        return replace(self, **{name: np.asarray(getattr(self, name), dtype = dtype) for name in "SKTvrq"})
+
+def log_moneyness(S: np.ndarray, K: np.ndarray) -> np.ndarray:
+    # always float64: in float32 log(S/K) near the money loses most of its digits
+    return np.log(np.divide(S, K, dtype = np.float64))
+
 def __ds(o: option) -> tuple:
     denominator = o.v * np.sqrt(o.T)
-    first_term  = np.log(o.S / o.K)
+    first_term  = log_moneyness(o.S, o.K)
     second_term = o.r - o.q + o.v * o.v / 2
 
     d1 = (1 / denominator) * (first_term + second_term * o.T)
@@ -22,96 +40,736 @@ def __ds(o: option) -> tuple:
 
     return d1, d2
 
+def priced_into(name: str, is_call: bool, dollar: bool = False):
+    """
+    Adds `out=` and `workspace=` keywords to a call_* / put_* function.
+    Without them the function runs as written; with them it goes through
+    greeks_into, writing the result to `out` and its intermediates to the
+    Workspace, so repeated calls allocate no arrays. `out` needs a
+    workspace, a new one per call would defeat its purpose.
+    """
+    key = "dollar_" + name if dollar else name
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, out: np.ndarray = None, workspace: "Workspace" = None):
+            if out is None and workspace is None:
+                return function(*args)
+
+            if workspace is None:
+                raise ValueError("out= needs a workspace=, build one with Workspace.for_option")
+
+            notional, o = args if dollar else (None, args[0])
+            outputs = {key: out} if out is not None else dict()
+            return greeks_into(o, (name,), is_call, workspace, notional, outputs)[key]
+        return wrapper
+    return decorate
+
+@priced_into("price", True)
+def call_price(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    return o.S * np.exp(-o.q * o.T) * normal.cdf(d1) - o.K * np.exp(-o.r * o.T) * normal.cdf(d2)
+
+@priced_into("delta", True)
 def call_delta(o: option) -> np.ndarray:
     d1, d2 = __ds(o)
-    deltas = np.exp(- o.q * o.T) * norm.cdf(d1)
+    deltas = np.exp(- o.q * o.T) * normal.cdf(d1)
     return deltas
 
+@priced_into("gamma", True)
 def call_gamma(o: option) -> np.ndarray:
     d1, _ = __ds(o)
-    g1 = np.exp(- o.q * o.T) * norm.pdf(d1)
+    g1 = np.exp(- o.q * o.T) * normal.pdf(d1)
     g2 = o.S * o.v * np.sqrt(o.T)
     return g1 / g2
 
+@priced_into("theta", True)
 def call_theta(o: option) -> np.ndarray:
     d1, d2 = __ds(o)
-    first_term  = - o.S * np.exp(-o.q * o.T) * norm.pdf(d1) * v / (2 * np.sqrt(o.T))
-    second_term = - o.r * o.K * np.exp(-o.r * o.T) * norm.cdf(d2)
-    third_term = o.q * o.S * np.exp(-o.q * o.T) * norm.cdf(d1)
+    first_term  = - o.S * np.exp(-o.q * o.T) * normal.pdf(d1) * o.v / (2 * np.sqrt(o.T))
+    second_term = - o.r * o.K * np.exp(-o.r * o.T) * normal.cdf(d2)
+    third_term = o.q * o.S * np.exp(-o.q * o.T) * normal.cdf(d1)
 
     this_theta = first_term + second_term + third_term
 
     return this_theta / 100
 
+@priced_into("vega", True)
 def call_vega(o: option) -> np.ndarray:
     d1, _ = __ds(o)
-    this_vega = o.S * np.exp(-o.q * o.T) * norm.pdf(d1) * np.sqrt(o.T)
+    this_vega = o.S * np.exp(-o.q * o.T) * normal.pdf(d1) * np.sqrt(o.T)
     return this_vega / 100
 
+@priced_into("rho", True)
 def call_rho(o: option) -> np.ndarray:
     _, d2 = __ds(o)
-    return o.K * np.exp(-o.r * o.T) * norm.cdf(d2) / 100
+    return o.K * np.exp(-o.r * o.T) * normal.cdf(d2) / 100
 
+@priced_into("delta", True, dollar = True)
 def call_dollar_delta(Notional: float, o: option) -> np.ndarray:
     return Notional * call_delta(o)
 
+@priced_into("gamma", True, dollar = True)
 def call_dollar_gamma(Notional: float, o: option) -> np.ndarray:
     return Notional * call_gamma(o) * o.S / 100
 
+@priced_into("theta", True, dollar = True)
 def call_dollar_theta(Notional: float, o: option) -> np.ndarray:
     return Notional * call_theta(o)
 
+@priced_into("vega", True, dollar = True)
 def call_dollar_vega(Notional: float, o: option) -> np.ndarray:
     return Notional * call_vega(o)
 
+@priced_into("rho", True, dollar = True)
 def call_dollar_rho(Notional: float, o: option) -> np.ndarray:
     return Notional * call_rho(o)
 
+@priced_into("price", False)
+def put_price(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    return o.K * np.exp(-o.r * o.T) * normal.cdf(-d2) - o.S * np.exp(-o.q * o.T) * normal.cdf(-d1)
+
+@priced_into("delta", False)
 def put_delta(o: option) -> np.ndarray:
     d1, _ = __ds(o)
-    deltas = np.exp(- o.q * o.T) * (norm.cdf(d1) - 1)
+    deltas = np.exp(- o.q * o.T) * (normal.cdf(d1) - 1)
     return deltas
 
+@priced_into("gamma", False)
 def put_gamma(o: option) -> np.ndarray:
     d1, _ = __ds(o)
-    g1 = np.exp(- o.q * o.T) * norm.pdf(d1)
+    g1 = np.exp(- o.q * o.T) * normal.pdf(d1)
     g2 = o.S * o.v * np.sqrt(o.T)
     return g1 / g2
 
+@priced_into("theta", False)
 def put_theta(o: option) -> np.ndarray:
     d1, d2 = __ds(o)
-    first_term  = - np.exp(o.q * o.T) * o.S * norm.pdf(d1) * o.v / (2 * np.sqrt(o.T))
-    second_term = + o.r * o.K * np.exp(-o.r * o.T) * norm.cdf(-d2)
-    third_term  = - o.q * o.S * np.exp(-o.q * o.T) * norm.cdf(-d1)
+    first_term  = - np.exp(-o.q * o.T) * o.S * normal.pdf(d1) * o.v / (2 * np.sqrt(o.T))
+    second_term = + o.r * o.K * np.exp(-o.r * o.T) * normal.cdf(-d2)
+    third_term  = - o.q * o.S * np.exp(-o.q * o.T) * normal.cdf(-d1)
 
     this_theta = first_term + second_term + third_term
 
     return this_theta / 100
 
+@priced_into("vega", False)
 def put_vega(o: option) -> np.ndarray:
     d1, _ = __ds(o)
-    this_vega = o.S * np.exp(-o.q * o.T) * norm.pdf(d1) * np.sqrt(o.T)
+    this_vega = o.S * np.exp(-o.q * o.T) * normal.pdf(d1) * np.sqrt(o.T)
     return this_vega / 100
 
+@priced_into("rho", False)
 def put_rho(o: option) -> np.ndarray:
     _, d2 = __ds(o)
-    return - o.K * np.exp(-o.r * o.T) * norm.cdf(-d2) / 100
+    return - o.K * np.exp(-o.r * o.T) * normal.cdf(-d2) / 100
 
+@priced_into("delta", False, dollar = True)
 def put_dollar_delta(Notional: float, o: option) -> np.ndarray:
     return Notional * put_delta(o)
 
+@priced_into("gamma", False, dollar = True)
 def put_dollar_gamma(Notional: float, o: option) -> np.ndarray:
     return Notional * put_gamma(o) * o.S / 100
 
+@priced_into("theta", False, dollar = True)
 def put_dollar_theta(Notional: float, o: option) -> np.ndarray:
     return Notional * put_theta(o)
 
+@priced_into("vega", False, dollar = True)
 def put_dollar_vega(Notional: float, o: option) -> np.ndarray:
     return Notional * put_vega(o)
 
+@priced_into("rho", False, dollar = True)
 def put_dollar_rho(Notional: float, o: option) -> np.ndarray:
     return Notional * put_rho(o)
 
+# Higher order greeks. Derivatives in the vol are per vol point (1/100)
+# like vega and derivatives in time are scaled by 1/100 like theta, so
+# volga is per vol point squared. Charm and color are the changes of delta
+# and gamma as time passes, with the sign convention of theta.
+
+def __carry(o: option, d2: np.ndarray) -> np.ndarray:
+    # 2 (r - q) T - d2 v sqrt(T), shared by charm and color
+    return 2 * (o.r - o.q) * o.T - d2 * o.v * np.sqrt(o.T)
+
+@priced_into("vanna", True)
+def call_vanna(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    return - np.exp(-o.q * o.T) * normal.pdf(d1) * d2 / o.v / 100
+
+@priced_into("volga", True)
+def call_volga(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    this_vega = o.S * np.exp(-o.q * o.T) * normal.pdf(d1) * np.sqrt(o.T)
+    return this_vega * d1 * d2 / o.v / 10000
+
+@priced_into("charm", True)
+def call_charm(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    first_term  = o.q * np.exp(-o.q * o.T) * normal.cdf(d1)
+    second_term = np.exp(-o.q * o.T) * normal.pdf(d1) * __carry(o, d2) / (2 * o.T * o.v * np.sqrt(o.T))
+    return (first_term - second_term) / 100
+
+@priced_into("speed", True)
+def call_speed(o: option) -> np.ndarray:
+    d1, _ = __ds(o)
+    denominator = o.v * np.sqrt(o.T)
+    return - call_gamma(o) / o.S * (d1 / denominator + 1)
+
+@priced_into("zomma", True)
+def call_zomma(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    return call_gamma(o) * (d1 * d2 - 1) / o.v / 100
+
+@priced_into("color", True)
+def call_color(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    denominator = o.v * np.sqrt(o.T)
+    g1 = np.exp(-o.q * o.T) * normal.pdf(d1) / (2 * o.S * o.T * denominator)
+    g2 = 2 * o.q * o.T + 1 + __carry(o, d2) / denominator * d1
+    return g1 * g2 / 100
+
+@priced_into("vanna", True, dollar = True)
+def call_dollar_vanna(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_vanna(o)
+
+@priced_into("volga", True, dollar = True)
+def call_dollar_volga(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_volga(o)
+
+@priced_into("charm", True, dollar = True)
+def call_dollar_charm(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_charm(o)
+
+@priced_into("speed", True, dollar = True)
+def call_dollar_speed(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_speed(o) * o.S / 100 * o.S / 100
+
+@priced_into("zomma", True, dollar = True)
+def call_dollar_zomma(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_zomma(o) * o.S / 100
+
+@priced_into("color", True, dollar = True)
+def call_dollar_color(Notional: float, o: option) -> np.ndarray:
+    return Notional * call_color(o) * o.S / 100
+
+@priced_into("vanna", False)
+def put_vanna(o: option) -> np.ndarray:
+    return call_vanna(o)
+
+@priced_into("volga", False)
+def put_volga(o: option) -> np.ndarray:
+    return call_volga(o)
+
+@priced_into("charm", False)
+def put_charm(o: option) -> np.ndarray:
+    d1, d2 = __ds(o)
+    first_term  = - o.q * np.exp(-o.q * o.T) * normal.cdf(-d1)
+    second_term = np.exp(-o.q * o.T) * normal.pdf(d1) * __carry(o, d2) / (2 * o.T * o.v * np.sqrt(o.T))
+    return (first_term - second_term) / 100
+
+@priced_into("speed", False)
+def put_speed(o: option) -> np.ndarray:
+    return call_speed(o)
+
+@priced_into("zomma", False)
+def put_zomma(o: option) -> np.ndarray:
+    return call_zomma(o)
+
+@priced_into("color", False)
+def put_color(o: option) -> np.ndarray:
+    return call_color(o)
+
+@priced_into("vanna", False, dollar = True)
+def put_dollar_vanna(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_vanna(o)
+
+@priced_into("volga", False, dollar = True)
+def put_dollar_volga(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_volga(o)
+
+@priced_into("charm", False, dollar = True)
+def put_dollar_charm(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_charm(o)
+
+@priced_into("speed", False, dollar = True)
+def put_dollar_speed(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_speed(o) * o.S / 100 * o.S / 100
+
+@priced_into("zomma", False, dollar = True)
+def put_dollar_zomma(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_zomma(o) * o.S / 100
+
+@priced_into("color", False, dollar = True)
+def put_dollar_color(Notional: float, o: option) -> np.ndarray:
+    return Notional * put_color(o) * o.S / 100
+
+GREEKS = ("price", "delta", "gamma", "theta", "vega", "rho")
+HIGHER_ORDER_GREEKS = ("vanna", "volga", "charm", "speed", "zomma", "color")
+ALL_GREEKS = GREEKS + HIGHER_ORDER_GREEKS
+
+# powers of S / 100 in the dollar greeks: gamma is the change of dollar
+# delta for a 1% move, speed the change of dollar gamma
+SPOT_ORDER = {"gamma": 1, "speed": 2, "zomma": 1, "color": 1}
+
+def add_dollar_greeks(result: dict, which: tuple, notional: np.ndarray, S: np.ndarray) -> dict:
+    for name in which:
+        result["dollar_" + name] = notional * result[name]
+        for _ in range(SPOT_ORDER.get(name, 0)):
+            result["dollar_" + name] = result["dollar_" + name] * S / 100
+
+    return result
+
+@dataclass
+class spot_terms:
+    """
+    Everything greeks() needs that does not depend on the spot. Build it
+    once with spot_independent_terms and reprice spot ticks with
+    greeks_at_spot, which only recomputes the log term and the normal
+    cdf/pdf.
+    """
+    o: option
+    sqrt_T: np.ndarray
+    denominator: np.ndarray
+    drift_term: np.ndarray
+    q_discount: np.ndarray
+    r_discount: np.ndarray
+
+def spot_independent_terms(o: option) -> spot_terms:
+    sqrt_T = np.sqrt(o.T)
+    return spot_terms( o                                        \
+                     , sqrt_T                                   \
+                     , o.v * sqrt_T                             \
+                     , (o.r - o.q + o.v * o.v / 2) * o.T        \
+                     , np.exp(-o.q * o.T)                       \
+                     , np.exp(-o.r * o.T)                       )
+
+def greeks_at_spot(t: spot_terms, 
+                   S: np.ndarray, 
+                   which: tuple = GREEKS, 
+                   notional: np.ndarray = None, 
+                   is_call = True) -> dict:
+    o = t.o
+    dtype = np.result_type(S, t.q_discount)
+    sign = np.where(is_call, 1.0, -1.0).astype(dtype)
+
+    # d1 and d2 stay in float64 whatever the storage precision, the normal
+    # terms are rounded to it once evaluated
+    d1 = (log_moneyness(S, o.K) + t.drift_term) / t.denominator
+    d2 = d1 - t.denominator
+
+    needs_cdf = {"price", "delta", "theta", "rho", "charm"}.intersection(which)
+    needs_pdf = {"gamma", "theta", "vega"}.union(HIGHER_ORDER_GREEKS).intersection(which)
+
+    cdf_d1 = normal.cdf(sign * d1).astype(dtype, copy = False) if needs_cdf else None
+    cdf_d2 = normal.cdf(sign * d2).astype(dtype, copy = False) if needs_cdf else None
+    spot_pdf = S * t.q_discount * normal.pdf(d1).astype(dtype, copy = False) if needs_pdf else None
+
+    result = dict()
+    if "price" in which:
+        result["price"] = sign * (S * t.q_discount * cdf_d1 - o.K * t.r_discount * cdf_d2)
+    if "delta" in which:
+        result["delta"] = sign * t.q_discount * cdf_d1
+    if "gamma" in which:
+        result["gamma"] = spot_pdf / (S * S * t.denominator)
+    if "theta" in which:
+        this_theta = - spot_pdf * o.v / (2 * t.sqrt_T)                 \
+                     - sign * o.r * o.K * t.r_discount * cdf_d2         \
+                     + sign * o.q * S * t.q_discount * cdf_d1
+        result["theta"] = this_theta / 100
+    if "vega" in which:
+        result["vega"] = spot_pdf * t.sqrt_T / 100
+    if "rho" in which:
+        result["rho"] = sign * o.K * t.r_discount * cdf_d2 / 100
+
+    if set(HIGHER_ORDER_GREEKS).intersection(which):
+        result.update(higher_order_at_spot(t, S, which, sign, d1, d2, cdf_d1, spot_pdf))
+
+    if notional is not None:
+        add_dollar_greeks(result, which, notional, S)
+
+    return result
+
+def higher_order_at_spot(t: spot_terms, S: np.ndarray, which: tuple, sign, d1, d2, cdf_d1, spot_pdf) -> dict:
+    """
+    vanna, volga, charm, speed, zomma and color from the d1, d2, N(d1)
+    and S exp(-qT) n(d1) that greeks_at_spot already has.
+    """
+    o = t.o
+    gamma = spot_pdf / (S * S * t.denominator)
+    density = spot_pdf / S
+    carry = 2 * (o.r - o.q) * o.T - d2 * t.denominator
+
+    result = dict()
+    if "vanna" in which:
+        result["vanna"] = - density * d2 / o.v / 100
+    if "volga" in which:
+        result["volga"] = spot_pdf * t.sqrt_T * d1 * d2 / o.v / 10000
+    if "charm" in which:
+        result["charm"] = (sign * o.q * t.q_discount * cdf_d1 - density * carry / (2 * o.T * t.denominator)) / 100
+    if "speed" in which:
+        result["speed"] = - gamma / S * (d1 / t.denominator + 1)
+    if "zomma" in which:
+        result["zomma"] = gamma * (d1 * d2 - 1) / o.v / 100
+    if "color" in which:
+        g2 = 2 * o.q * o.T + 1 + carry / t.denominator * d1
+        result["color"] = density / (2 * S * o.T * t.denominator) * g2 / 100
+
+    return result
+
+class Workspace:
+    """
+    Preallocated intermediates and outputs for pricing one book shape over
+    and over, e.g. intraday reprices of a fixed book on a scenario grid.
+
+    `shape` is the broadcast shape of the option arrays (scenarios,
+    options). d1 and d2 are float64, everything else is `dtype`; in float32
+    the float64 math goes through `scratch_d` and explicit casts, so no
+    ufunc needs casting buffers. Outputs
+    not passed explicitly are allocated on first use and reused, so the
+    arrays returned by greeks_into are overwritten by the next call.
+    Inputs of another dtype are cast into arrays kept here as well.
+    """
+    def __init__(self, shape: tuple, dtype = np.float64):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self.d1 = np.empty(self.shape)
+        self.d2 = np.empty(self.shape)
+        self.sqrt_T, self.denominator, self.q_discount, self.r_discount, \
+        self.cdf_d1, self.cdf_d2, self.spot_pdf, self.scratch = (np.empty(self.shape, self.dtype) for _ in range(8))
+
+        # float64 twins of the dtype arrays, the same arrays in float64
+        wide = self.dtype == np.float64
+        self.sign = np.empty(self.shape, self.dtype)
+        self.sign_d = self.sign if wide else np.empty(self.shape)
+        self.scratch_d = self.scratch if wide else np.empty(self.shape)
+        self.d1_cast = self.d1 if wide else np.empty(self.shape, self.dtype)
+        self.d2_cast = self.d2 if wide else np.empty(self.shape, self.dtype)
+        self.outputs = dict()
+        self.cast_option = None
+        self.cast_notional = None
+
+    @classmethod
+    def for_option(cls, o: option, dtype = None) -> "Workspace":
+        shape = np.broadcast_shapes(*(np.shape(getattr(o, name)) for name in "SKTvrq"))
+        return cls(shape, dtype if dtype is not None else o.dtype)
+
+    def signs(self, is_call) -> tuple:
+        # a single bool needs no array, a mask is written into the sign
+        # arrays on every call, so changes made to it in place are seen
+        if np.ndim(is_call) == 0:
+            sign = 1.0 if is_call else -1.0
+            return sign, sign
+        np.copyto(self.sign, -1.0)
+        np.copyto(self.sign, 1.0, where = is_call)
+        if self.sign_d is not self.sign:
+            np.copyto(self.sign_d, self.sign)
+        return self.sign, self.sign_d
+
+    def inputs(self, o: option) -> option:
+        """
+        `o` itself when stored in the workspace dtype, otherwise its fields
+        copied into arrays of that dtype that are reused by the next call.
+        """
+        if o.dtype == self.dtype:
+            return o
+        shapes = tuple(np.shape(getattr(o, name)) for name in "SKTvrq")
+        if self.cast_option is None or shapes != tuple(getattr(self.cast_option, name).shape for name in "SKTvrq"):
+            self.cast_option = option(*(np.empty(shape, self.dtype) for shape in shapes))
+        for name in "SKTvrq":
+            np.copyto(getattr(self.cast_option, name), getattr(o, name))
+        return self.cast_option
+
+    def notional(self, notional: np.ndarray) -> np.ndarray:
+        if notional is None or np.result_type(notional) == self.dtype:
+            return notional
+        if self.cast_notional is None or self.cast_notional.shape != np.shape(notional):
+            self.cast_notional = np.empty(np.shape(notional), self.dtype)
+        np.copyto(self.cast_notional, notional)
+        return self.cast_notional
+
+    def widened(self, x: np.ndarray) -> np.ndarray:
+        # x in float64, copied to scratch_d when stored in single precision
+        if np.result_type(x) == np.float64:
+            return x
+        np.copyto(self.scratch_d, x)
+        return self.scratch_d
+
+    def evaluate(self, function, x: np.ndarray, out: np.ndarray) -> np.ndarray:
+        # function(x, out = ...) in float64, cast into out at the end
+        if out.dtype == np.float64:
+            return function(x, out = out)
+        np.copyto(out, function(x, out = self.scratch_d))
+        return out
+
+    def ds(self) -> tuple:
+        # d1 and d2 in the workspace dtype, for the higher order greeks
+        if self.d1_cast is not self.d1:
+            np.copyto(self.d1_cast, self.d1)
+            np.copyto(self.d2_cast, self.d2)
+        return self.d1_cast, self.d2_cast
+
+    def output(self, name: str) -> np.ndarray:
+        if name not in self.outputs:
+            self.outputs[name] = np.empty(self.shape, self.dtype)
+        return self.outputs[name]
+
+def greeks_into(o: option, 
+                which: tuple, 
+                is_call, 
+                w: Workspace, 
+                notional: np.ndarray = None, 
+                out: dict = None) -> dict:
+    """
+    greeks() evaluated in place: every intermediate lives in `w` and the
+    results are written to the arrays in `out` (keyed like greeks()) or
+    to `w`'s own outputs. Once `w` is warm no array is allocated.
+    """
+    o, notional = w.inputs(o), w.notional(notional)
+    out = out if out is not None else dict()
+    sign, sign_d = w.signs(is_call)
+
+    np.sqrt(o.T, out = w.sqrt_T)
+    np.multiply(o.v, w.sqrt_T, out = w.denominator)
+
+    # drift, kept in scratch until d1 is done
+    np.multiply(o.v, o.v, out = w.scratch)
+    w.scratch *= 0.5
+    w.scratch += o.r
+    w.scratch -= o.q
+    w.scratch *= o.T
+
+    np.copyto(w.d1, o.S)
+    w.d1 /= w.widened(o.K)
+    np.log(w.d1, out = w.d1)
+    w.d1 += w.widened(w.scratch)
+    denominator = w.widened(w.denominator)
+    w.d1 /= denominator
+    np.subtract(w.d1, denominator, out = w.d2)
+
+    np.multiply(o.q, o.T, out = w.q_discount)
+    np.negative(w.q_discount, out = w.q_discount)
+    np.exp(w.q_discount, out = w.q_discount)
+    np.multiply(o.r, o.T, out = w.r_discount)
+    np.negative(w.r_discount, out = w.r_discount)
+    np.exp(w.r_discount, out = w.r_discount)
+
+    # the pdf is even, so d1 can be flipped for the cdf first; the higher
+    # order greeks need the signs back
+    if {"price", "delta", "theta", "rho", "charm"}.intersection(which):
+        w.d1 *= sign_d
+        w.d2 *= sign_d
+        w.evaluate(normal.cdf, w.d1, w.cdf_d1)
+        w.evaluate(normal.cdf, w.d2, w.cdf_d2)
+        if set(HIGHER_ORDER_GREEKS).intersection(which):
+            w.d1 *= sign_d
+            w.d2 *= sign_d
+    if {"gamma", "theta", "vega"}.union(HIGHER_ORDER_GREEKS).intersection(which):
+        w.evaluate(normal.pdf, w.d1, w.spot_pdf)
+        w.spot_pdf *= o.S
+        w.spot_pdf *= w.q_discount
+
+    result = {name: out[name] if name in out else w.output(name) for name in which}
+    if "price" in which:
+        price = result["price"]
+        np.multiply(o.S, w.q_discount, out = price)
+        price *= w.cdf_d1
+        np.multiply(o.K, w.r_discount, out = w.scratch)
+        w.scratch *= w.cdf_d2
+        price -= w.scratch
+        price *= sign
+    if "delta" in which:
+        np.multiply(sign, w.q_discount, out = result["delta"])
+        result["delta"] *= w.cdf_d1
+    if "gamma" in which:
+        gamma = result["gamma"]
+        np.multiply(o.S, o.S, out = gamma)
+        gamma *= w.denominator
+        np.divide(w.spot_pdf, gamma, out = gamma)
+    if "theta" in which:
+        theta = result["theta"]
+        np.multiply(w.spot_pdf, o.v, out = theta)
+        theta /= w.sqrt_T
+        theta *= -0.5
+        np.multiply(o.r, o.K, out = w.scratch)
+        w.scratch *= w.r_discount
+        w.scratch *= w.cdf_d2
+        w.scratch *= sign
+        theta -= w.scratch
+        np.multiply(o.q, o.S, out = w.scratch)
+        w.scratch *= w.q_discount
+        w.scratch *= w.cdf_d1
+        w.scratch *= sign
+        theta += w.scratch
+        theta /= 100
+    if "vega" in which:
+        np.multiply(w.spot_pdf, w.sqrt_T, out = result["vega"])
+        result["vega"] /= 100
+    if "rho" in which:
+        rho = result["rho"]
+        np.multiply(sign, o.K, out = rho)
+        rho *= w.r_discount
+        rho *= w.cdf_d2
+        rho /= 100
+    if set(HIGHER_ORDER_GREEKS).intersection(which):
+        higher_order_into(o, which, w, sign, result)
+
+    if notional is not None:
+        for name in which:
+            key = "dollar_" + name
+            dollar = result[key] = out[key] if key in out else w.output(key)
+            np.multiply(notional, result[name], out = dollar)
+            for _ in range(SPOT_ORDER.get(name, 0)):
+                dollar *= o.S
+                dollar /= 100
+
+    return result
+
+def carry_into(o: option, w: Workspace, d2: np.ndarray, out: np.ndarray) -> np.ndarray:
+    # 2 (r - q) T - d2 v sqrt(T), needs the scratch array
+    np.subtract(o.r, o.q, out = w.scratch)
+    w.scratch *= o.T
+    w.scratch *= 2
+    np.multiply(d2, w.denominator, out = out)
+    np.subtract(w.scratch, out, out = out)
+    return out
+
+def higher_order_into(o: option, which: tuple, w: Workspace, sign, result: dict) -> None:
+    """
+    The in-place counterpart of higher_order_at_spot, for greeks_into.
+    """
+    d1, d2 = w.ds()
+    if "vanna" in which:
+        vanna = result["vanna"]
+        np.divide(w.spot_pdf, o.S, out = vanna)
+        vanna *= d2
+        vanna /= o.v
+        vanna /= -100
+    if "volga" in which:
+        volga = result["volga"]
+        np.multiply(w.spot_pdf, w.sqrt_T, out = volga)
+        volga *= d1
+        volga *= d2
+        volga /= o.v
+        volga /= 10000
+    if "charm" in which:
+        charm = carry_into(o, w, d2, result["charm"])
+        charm *= w.spot_pdf
+        charm /= o.S
+        charm /= 2
+        charm /= o.T
+        charm /= w.denominator
+        np.multiply(o.q, w.q_discount, out = w.scratch)
+        w.scratch *= w.cdf_d1
+        w.scratch *= sign
+        np.subtract(w.scratch, charm, out = charm)
+        charm /= 100
+    if "speed" in which:
+        speed = result["speed"]
+        np.divide(d1, w.denominator, out = speed)
+        speed += 1
+        speed *= w.spot_pdf
+        speed /= o.S
+        speed /= o.S
+        speed /= w.denominator
+        speed /= o.S
+        np.negative(speed, out = speed)
+    if "zomma" in which:
+        zomma = result["zomma"]
+        np.multiply(d1, d2, out = zomma)
+        zomma -= 1
+        zomma *= w.spot_pdf
+        zomma /= o.S
+        zomma /= o.S
+        zomma /= w.denominator
+        zomma /= o.v
+        zomma /= 100
+    if "color" in which:
+        color = carry_into(o, w, d2, result["color"])
+        color /= w.denominator
+        color *= d1
+        np.multiply(o.q, o.T, out = w.scratch)
+        w.scratch *= 2
+        w.scratch += 1
+        color += w.scratch
+        color *= w.spot_pdf
+        color /= o.S
+        color /= 2
+        color /= o.S
+        color /= o.T
+        color /= w.denominator
+        color /= 100
+
+def numpy_greeks(o: option, which: tuple, is_call) -> dict:
+    return greeks_at_spot(spot_independent_terms(o), o.S, which, None, is_call)
+
+backends.register("numpy", numpy_greeks)
+
+def greeks(o: option, 
+           which: tuple = GREEKS, 
+           notional: np.ndarray = None, 
+           is_call: bool = True, 
+           backend: str = None, 
+           precision: str = None, 
+           out: dict = None, 
+           workspace: Workspace = None) -> dict:
+    """
+    Single pass evaluation of the greeks in `which`.
+
+    `is_call` is either a bool or a mask broadcastable against the option
+    arrays, so a mixed call/put book is priced in one call.
+
+    d1, d2, the discount factors and the normal cdf/pdf are computed once
+    and shared by every requested greek. Results match the call_* / put_*
+    functions above. When `notional` is given the dollar greeks are added
+    under the keys "dollar_<greek>".
+
+    `backend` picks the kernel from utils.backends ("numpy", "numexpr",
+    "numba"); None uses the configured default. `which` may also name the
+    HIGHER_ORDER_GREEKS (vanna, volga, charm, speed, zomma, color), which
+    are always evaluated by the numpy kernel.
+
+    `precision` is "float64" or "float32", None keeps the precision of the
+    option arrays. In float32 inputs and outputs are stored in single
+    precision, halving the memory of large scenario grids, while log(S/K),
+    d1 and d2 are still evaluated in float64.
+
+    With a `workspace` (see Workspace) the greeks are evaluated in place
+    in its dtype, writing to the arrays in `out` when given; `out` alone
+    is rejected.
+    """
+    unknown = set(which) - set(ALL_GREEKS)
+    if unknown:
+        raise ValueError("unknown greeks: {:}".format(sorted(unknown)))
+    if precision is not None and precision not in PRECISIONS:
+        raise ValueError("unknown precision: {:}, expected one of {:}".format(precision, PRECISIONS))
+
+    if workspace is not None:
+        if precision is not None and np.dtype(precision) != workspace.dtype:
+            raise ValueError("precision {:} does not match the {:} workspace".format(precision, workspace.dtype))
+        return greeks_into(o, which, is_call, workspace, notional, out)
+    if out is not None:
+        raise ValueError("out= needs a workspace=, build one with Workspace.for_option")
+
+    dtype = np.dtype(precision) if precision is not None else o.dtype
+    if o.dtype != dtype:
+        o = o.astype(dtype)
+
+    # the other backends only implement the first order greeks
+    kernel = backends.get(backend)
+    if set(HIGHER_ORDER_GREEKS).intersection(which):
+        kernel = numpy_greeks
+    result = kernel(o, which, is_call)
+    for name in which:
+        result[name] = result[name].astype(dtype, copy = False)
+
+    if notional is not None:
+        add_dollar_greeks(result, which, np.asarray(notional, dtype = dtype), o.S)
+
+    return result
 
 """
 def __ds(S: np.ndarray, \
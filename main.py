@@ -1,68 +1,204 @@
 #!usr/bin/env python3
 import os
 import sys
+import argparse
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-import utils.tables
 import black_scholes
 from utils.data_handling import *
+from utils.book import book_from_columns, book_greek_to_dataframe
+from utils.pipeline import run_pipeline, WriterSink
+from utils.aggregate import aggregate_book
+from utils.writers import open_writer
+import utils.cache
+import utils.profiling
 
 pd.options.display.float_format = "{:,.2f}".format
 
-EXCEL_OUTPUT_FILE = "greeks.xlsx"
+OUTPUT_FILE = "greeks"
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
 MAIN_DIRECTORY = os.path.dirname(__file__)
+OUTPUT_DIRECTORY = os.path.join(MAIN_DIRECTORY, "data")
 
-def parse_extension_of_data(file: str) -> tuple:
-    if "xlsx" in file: 
-        calls, puts = fetch_data_from_excel(file)
-    elif "pickle" in file: 
-        calls, puts = fetch_data_from_pickle(file)
-    else:
+DATA_READERS = { ".xlsx"    : read_data_from_excel     \
+                , ".pickle"  : read_data_from_pickle    \
+                , ".parquet" : read_data_from_parquet   \
+                , ".arrow"   : read_data_from_arrow     \
+                , ".feather" : read_data_from_arrow     \
+                , ".npy"     : read_data_from_numpy     \
+                , ".npz"     : read_data_from_numpy     }
+
+def parse_extension_of_data(file: str):
+    _, extension = os.path.splitext(file)
+    if extension not in DATA_READERS:
         print("ERROR: Cannot parse database file")
         sys.exit(1)
 
-    return calls, puts
+    return DATA_READERS[extension](file)
 
-def main(file: str) -> None:
+def load_book(file: str):
+    return book_from_columns(parse_extension_of_data(file))
 
+def spot_ladder() -> np.ndarray:
     # interval = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 15, 20, 25,30,40,50]) / 100
     interval = np.array([1, 2, 5, 7, 10]) / 100
-    main_interval = np.concatenate((-np.flip(interval), 0, interval), axis = None)
-    
-    calls, puts = parse_extension_of_data(file)
-    call_options, call_notionals, call_names = extract_option_params(calls)
-    put_options, put_notionals, put_names = extract_option_params(puts)
+    return np.concatenate((-np.flip(interval), 0, interval), axis = None)
 
-    call_options.S = generate_spot_interval(call_options.S, main_interval)
-    put_options.S = generate_spot_interval(put_options.S, main_interval)
+def output_path(output_format: str, directory: str = OUTPUT_DIRECTORY) -> str:
+    return os.path.join(directory, OUTPUT_FILE + "." + output_format)
 
-    call_deltas = black_scholes.call_dollar_delta(call_notionals, call_options)
-    put_deltas = black_scholes.put_dollar_delta(put_notionals, put_options)
+def stream(file: str, chunk_rows: int, output_format: str = "xlsx", directory: str = OUTPUT_DIRECTORY) -> None:
+    main_interval = spot_ladder()
 
-    call_gammas = black_scholes.call_dollar_gamma(call_notionals, call_options)
-    put_gammas = black_scholes.put_dollar_gamma(put_notionals, put_options)
+    with utils.profiling.stage("pipeline"), open_writer(output_path(output_format, directory)) as writer:
+        sink = WriterSink(writer, ("delta", "gamma"), main_interval)
+        aggregate = run_pipeline(file, main_interval, sink, chunk_rows)
 
-    column_names = ["Delta {:}%".format(int(100 * x)) for x in main_interval]
-    table_delta = consolidate_call_put_into_dataframe(call_deltas, call_names, put_deltas, put_names, column_names)
-    table_delta.name = "table_delta"
+    for name in aggregate.which:
+        rows = {"Total": aggregate.totals[name]}
+        rows.update({k: v[name] for k, v in aggregate.by_underlying.items()})
+        print_aggregate(name, aggregate.count, rows, main_interval)
 
-    column_names = ["Gamma {:}%".format(int(100 * x)) for x in main_interval]
-    table_gamma = consolidate_call_put_into_dataframe(call_gammas, call_names, put_gammas, put_names, column_names)
-    table_gamma.name = "table_gamma"
+def print_aggregate(name: str, count: int, rows: dict, percentuals: np.ndarray) -> None:
+    columns = ["{:}%".format(int(100 * x)) for x in percentuals]
+    print("Dollar {:} ({:} options)".format(name, count))
+    print(pd.DataFrame(rows, index = columns).T)
 
-    output_path = os.path.join(MAIN_DIRECTORY, "data", EXCEL_OUTPUT_FILE)
-    with pd.ExcelWriter(output_path) as writer:
-        table_delta.to_excel(writer, sheet_name = "Delta")
-        table_gamma.to_excel(writer, sheet_name = "Gamma")
-    
-    p_delta = utils.tables.plot_table(table_delta)
-    p_gamma = utils.tables.plot_table(table_gamma)
+def by_underlying(file: str, use_cache: bool = True, precision: str = "float64") -> None:
+    main_interval = spot_ladder()
+
+    with utils.profiling.stage("load"):
+        book = utils.cache.cached_book(file, load_book) if use_cache else load_book(file)
+
+    with utils.profiling.stage("aggregate", book):
+        aggregate = aggregate_book(book, main_interval, precision = precision)
+
+    for name in aggregate.totals:
+        rows = {"Total": aggregate.totals[name]}
+        rows.update(zip(aggregate.names.astype(str), aggregate.by_underlying[name].T))
+        print_aggregate(name, len(book), rows, main_interval)
+
+def value_at_risk(file: str, returns_file: str, level: float, use_cache: bool = True) -> None:
+    # imported here, like the plotting stack, so the default run does not pay for it
+    import utils.var
+
+    with utils.profiling.stage("load"):
+        book = utils.cache.cached_book(file, load_book) if use_cache else load_book(file)
+        returns = utils.var.returns_for_book(utils.var.read_returns(returns_file), book)
+
+    with utils.profiling.stage("var", book):
+        report = utils.var.historical_var(book, returns, level)
+
+    print("{:} scenarios, {:.1%} {:}-day VaR = {:,.2f}, ES = {:,.2f}".format(
+          len(returns), report.level, report.horizon_days, report.var, report.es))
+    print("ES contributions by underlying")
+    print(pd.Series(report.underlying_contributions, index = book.names.astype(str)).sort_values().to_string())
+    print("Largest ES contributions by option")
+    print(pd.Series(report.option_contributions[report.top_options], index = book.labels[report.top_options]).to_string())
+
+def main(file: str, 
+         use_cache: bool = True, 
+         plot: bool = True, 
+         output_format: str = "xlsx", 
+         precision: str = "float64", 
+         directory: str = OUTPUT_DIRECTORY) -> None:
+
+    main_interval = spot_ladder()
     
-    utils.tables.save_table_heatmap(p_delta, os.path.join(MAIN_DIRECTORY, "data", "table_delta.png"))
-    utils.tables.save_table_heatmap(p_gamma, os.path.join(MAIN_DIRECTORY, "data", "table_gamma.png"))
+    with utils.profiling.stage("load"):
+        book = utils.cache.cached_book(file, load_book) if use_cache else load_book(file)
+    with utils.profiling.stage("spot ladder", book):
+        book.S = generate_spot_interval(book.S, main_interval)
+
+    with utils.profiling.stage("pricing", book):
+        book_greeks = black_scholes.greeks(book, ("delta", "gamma"), book.notional, book.is_call, 
+                                           precision = precision)
+
+    with utils.profiling.stage("tables", book_greeks):
+        column_names = scenario_column_names("Delta", main_interval)
+        table_delta = book_greek_to_dataframe(book_greeks["dollar_delta"], book, column_names)
+        table_delta.name = "table_delta"
+
+        column_names = scenario_column_names("Gamma", main_interval)
+        table_gamma = book_greek_to_dataframe(book_greeks["dollar_gamma"], book, column_names)
+        table_gamma.name = "table_gamma"
+
+    with utils.profiling.stage("write"):
+        write_tables([table_delta, table_gamma], ["Delta", "Gamma"], output_format, directory)
+
+    if plot:
+        with utils.profiling.stage("plot"):
+            plot_tables([table_delta, table_gamma], directory)
+
+def write_tables(tables: list, sheet_names: list, output_format: str, directory: str = OUTPUT_DIRECTORY) -> None:
+    with open_writer(output_path(output_format, directory)) as writer:
+        for table, sheet_name in zip(tables, sheet_names):
+            writer.write_table(sheet_name, table)
+
+def plot_tables(tables: list, directory: str = OUTPUT_DIRECTORY) -> None:
+    # the plotting stack costs more to import than the rest of the run
+    import matplotlib.pyplot as plt
+    import utils.tables
+
+    paths = [os.path.join(directory, table.name + ".png") for table in tables]
+
+    if not all(utils.tables.fits_annotated_heatmap(table) for table in tables):
+        utils.tables.render_tables(tables, paths)
+        return
+
+    for table, where in zip(tables, paths):
+        heatmap = utils.tables.plot_table(table)
+        utils.tables.save_table_heatmap(heatmap, where)
     plt.show()
 
-if __name__ == "__main__": main(sys.argv[1])
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description = "Dollar delta and gamma heatmaps over a spot ladder")
+    parser.add_argument("file", help = "xlsx, pickle, parquet, arrow/feather, npy or npz book (csv too with --chunk-rows)")
+    parser.add_argument("--chunk-rows", type = int, default = None, 
+                        help = "stream the book in chunks of this many rows, writing as it goes")
+    parser.add_argument("--no-cache", action = "store_true", 
+                        help = "parse the book again instead of using the parsed-input cache")
+    parser.add_argument("--clear-cache", action = "store_true", 
+                        help = "empty the parsed-input cache before running")
+    parser.add_argument("--no-plot", action = "store_true", 
+                        help = "skip the heatmaps, the plotting libraries are never imported")
+    parser.add_argument("--format", choices = OUTPUT_FORMATS, default = "xlsx", 
+                        help = "format of the greeks tables written to data/ (csv and parquet write one file per greek)")
+    parser.add_argument("--output-dir", default = OUTPUT_DIRECTORY, 
+                        help = "directory of the greeks tables and heatmaps, data/ by default")
+    parser.add_argument("--precision", choices = black_scholes.PRECISIONS, default = "float64", 
+                        help = "storage precision of the option inputs and greeks (d1 is always float64)")
+    parser.add_argument("--by-underlying", action = "store_true", 
+                        help = "print the dollar greeks summed per underlying and for the book, without per-option tables")
+    parser.add_argument("--var", metavar = "RETURNS", default = None, 
+                        help = "historical simulation VaR/ES from a date x underlying returns file (csv, xlsx, pickle, parquet)")
+    parser.add_argument("--var-level", type = float, default = 0.99, 
+                        help = "confidence level of --var")
+    parser.add_argument("--profile", metavar = "TRACE", default = None, 
+                        help = "time each stage and pricing kernel and write a Chrome trace to TRACE "
+                               "(also enabled by $" + utils.profiling.PROFILE_ENVIRONMENT_VARIABLE + ")")
+    return parser.parse_args()
+
+if __name__ == "__main__": 
+    arguments = parse_arguments()
+    if arguments.profile:
+        utils.profiling.enable(arguments.profile)
+    else:
+        utils.profiling.enable_from_environment()
+    if arguments.clear_cache:
+        utils.cache.clear()
+    if arguments.var:
+        value_at_risk(arguments.file, arguments.var, arguments.var_level, use_cache = not arguments.no_cache)
+    elif arguments.by_underlying:
+        by_underlying(arguments.file, use_cache = not arguments.no_cache, precision = arguments.precision)
+    elif arguments.chunk_rows:
+        stream(arguments.file, arguments.chunk_rows, arguments.format, arguments.output_dir)
+    else:
+        main(arguments.file, 
+             use_cache = not arguments.no_cache, 
+             plot = not arguments.no_plot, 
+             output_format = arguments.format, 
+             precision = arguments.precision, 
+             directory = arguments.output_dir)
 
@@ -1,4 +1,20 @@
-from utils.option import Call, Put
+import math
+import tracemalloc
+from dataclasses import replace
+
+import numpy as np
+
+import black_scholes
+from utils import backends
+from utils.option import Call, Put, OptionArray
+from utils.implied_vol import implied_vol
+from utils.montecarlo import monte_carlo_price
+from utils.book import OptionBook
+from utils.proxy import shocked_book
+from utils.var import historical_var
+from utils.scenarios import WORKING_ARRAYS, MIN_VOL, scenario_grid
+from utils.parallel import SharedMemoryPricer
+from utils.data_handling import generate_spot_interval
 
 call_price_test = { 'answer' : 5.85       \
                   , 'S' : 65.0            \
@@ -140,6 +156,362 @@ def run_tests(test_dict: dict, which):
         print("For {:}:\n\tTrue value = {:.2f}\n\tComp Value = {:.2f}".format(test, true_answer, our_answer))
 
 
+def theta_closed_form(tol: float = 1e-12):
+    """
+    Theta per year on Hull's example (S 49, K 50, r 5%, vol 20%, 20 weeks,
+    call theta -4.31) and, with a dividend yield, against the closed form
+    written out with math. black_scholes scales theta by 1/100, Call and
+    Put by THETA_NORMALIZATION.
+    """
+    hull = black_scholes.option(49.0, 50.0, 20 / 52, 0.2, 0.05, 0.0)
+    error = abs(100 * black_scholes.call_theta(hull) + 4.31)
+    status = "OK" if error < 0.005 else "FAIL"
+    print("Theta on Hull's example:\n\tCall theta = {:.2f} {:}".format(100 * black_scholes.call_theta(hull), status))
+
+    S, K, T, v, r, q = 49.0, 50.0, 20 / 52, 0.2, 0.05, 0.03
+    d1 = (math.log(S / K) + (r - q + v * v / 2) * T) / (v * math.sqrt(T))
+    d2 = d1 - v * math.sqrt(T)
+    cdf = lambda x: math.erfc(-x / math.sqrt(2)) / 2
+    decay = - S * math.exp(-q * T) * math.exp(-d1 * d1 / 2) / math.sqrt(2 * math.pi) * v / (2 * math.sqrt(T))
+    expected = { True  : decay - r * K * math.exp(-r * T) * cdf(d2) + q * S * math.exp(-q * T) * cdf(d1)    \
+               , False : decay + r * K * math.exp(-r * T) * cdf(-d2) - q * S * math.exp(-q * T) * cdf(-d1) }
+
+    o = black_scholes.option(S, K, T, v, r, q)
+    for is_call, function, which in ((True, black_scholes.call_theta, Call), (False, black_scholes.put_theta, Put)):
+        values = ( 100 * function(o)                                                               \
+                 , 100 * black_scholes.greeks(o, ("theta",), is_call = is_call)["theta"]           \
+                 , which(S = S, K = K, T = T, v = v, r = r, q = q).theta() / Call.THETA_NORMALIZATION )
+        error = max(abs(x - expected[is_call]) for x in values) / abs(expected[is_call])
+        status = "OK" if error < tol else "FAIL"
+        print("{:} theta closed form:\n\tMax rel err = {:.2e} {:}".format(which.__name__, error, status))
+
+def masked_parity(size: int = 10000, tol: float = 1e-12):
+    """
+    greeks() on a mixed book with an is_call mask: call - put prices must
+    satisfy put-call parity, S exp(-qT) - K exp(-rT), and every greek and
+    dollar greek must match the call_* / put_* function of its type.
+    """
+    rng = np.random.default_rng(5)
+    o = black_scholes.option( rng.uniform(50, 150, size)    \
+                            , rng.uniform(50, 150, size)    \
+                            , rng.uniform(0.05, 2, size)    \
+                            , rng.uniform(0.05, 1, size)    \
+                            , rng.uniform(0, 0.1, size)     \
+                            , rng.uniform(0, 0.05, size)    )
+    is_call = rng.random(size) < 0.5
+    notional = rng.normal(size = size)
+
+    mixed = black_scholes.greeks(o, black_scholes.ALL_GREEKS, notional, is_call)
+    swapped = black_scholes.greeks(o, ("price",), is_call = ~is_call)["price"]
+    calls = np.where(is_call, mixed["price"], swapped)
+    puts = np.where(is_call, swapped, mixed["price"])
+    parity = o.S * np.exp(-o.q * o.T) - o.K * np.exp(-o.r * o.T)
+    error = np.max(np.abs(calls - puts - parity) / o.S)
+    status = "OK" if error < tol else "FAIL"
+    print("Masked put-call parity:\n\tMax rel err = {:.2e} {:}".format(error, status))
+
+    error = 0.0
+    for name in black_scholes.ALL_GREEKS:
+        for key, arguments in ((name, (o,)), ("dollar_" + name, (notional, o))):
+            call, put = (getattr(black_scholes, "{:}_{:}".format(kind, key), None) for kind in ("call", "put"))
+            if call is None:
+                continue
+            reference = np.where(is_call, call(*arguments), put(*arguments))
+            error = max(error, np.max(np.abs(mixed[key] - reference) / (1 + np.abs(reference))))
+    status = "OK" if error < tol else "FAIL"
+    print("Masked greeks against call_* / put_*:\n\tMax rel err = {:.2e} {:}".format(error, status))
+
+# lower order greek bumped, input bumped and the scaling of the difference
+BUMPS = { "vanna" : ("delta", "v", 1 / 100)     \
+        , "volga" : ("vega",  "v", 1 / 100)     \
+        , "charm" : ("delta", "T", -1 / 100)    \
+        , "speed" : ("gamma", "S", 1)           \
+        , "zomma" : ("gamma", "v", 1 / 100)     \
+        , "color" : ("gamma", "T", -1 / 100)    }
+
+def higher_order_differences(size: int = 2000, bump: float = 1e-5, tol: float = 1e-7):
+    """
+    Every higher order greek against a central difference of the greek it
+    differentiates, for calls and puts, and the dollar greeks of greeks()
+    and of call_dollar_* / put_dollar_* against notional * difference *
+    (S / 100)^SPOT_ORDER. `bump` is relative to the bumped input.
+    """
+    rng = np.random.default_rng(6)
+    o = black_scholes.option( rng.uniform(80, 120, size)    \
+                            , rng.uniform(80, 120, size)    \
+                            , rng.uniform(0.25, 2, size)    \
+                            , rng.uniform(0.15, 0.6, size)  \
+                            , rng.uniform(0, 0.1, size)     \
+                            , rng.uniform(0, 0.05, size)    )
+    notional = rng.normal(size = size)
+
+    for name, (lower, field, scale) in BUMPS.items():
+        error = 0.0
+        for is_call, kind in ((True, "call"), (False, "put")):
+            h = bump * getattr(o, field)
+            up = black_scholes.greeks(replace(o, **{field: getattr(o, field) + h}), (lower,), is_call = is_call)
+            down = black_scholes.greeks(replace(o, **{field: getattr(o, field) - h}), (lower,), is_call = is_call)
+            difference = (up[lower] - down[lower]) / (2 * h) * scale
+            dollar = notional * difference * (o.S / 100) ** black_scholes.SPOT_ORDER.get(name, 0)
+
+            result = black_scholes.greeks(o, (name,), notional, is_call)
+            per_type = getattr(black_scholes, "{:}_dollar_{:}".format(kind, name))(notional, o)
+            error = max( error                                                                          \
+                       , np.max(np.abs(result[name] - difference)) / np.max(np.abs(difference))         \
+                       , np.max(np.abs(result["dollar_" + name] - dollar)) / np.max(np.abs(dollar))     \
+                       , np.max(np.abs(per_type - dollar)) / np.max(np.abs(dollar))                     )
+        status = "OK" if error < tol else "FAIL"
+        print("{:} against bumped {:}:\n\tMax rel err = {:.2e} {:}".format(name.capitalize(), lower, error, status))
+
+def backend_parity(size: int = 10000, tol: float = 1e-10):
+    rng = np.random.default_rng(0)
+    o = black_scholes.option( rng.uniform(50, 150, size)    \
+                            , rng.uniform(50, 150, size)    \
+                            , rng.uniform(0.05, 2, size)    \
+                            , rng.uniform(0.05, 1, size)    \
+                            , rng.uniform(0, 0.1, size)     \
+                            , rng.uniform(0, 0.05, size)    )
+    is_call = rng.random(size) < 0.5
+    notional = rng.normal(size = size)
+
+    reference = black_scholes.greeks(o, notional = notional, is_call = is_call, backend = "numpy")
+    for backend in backends.available():
+        result = black_scholes.greeks(o, notional = notional, is_call = is_call, backend = backend)
+        error = max(np.max(np.abs(result[k] - reference[k]) / (1 + np.abs(reference[k]))) for k in reference)
+        status = "OK" if error < tol else "FAIL"
+        print("Backend {:}:\n\tMax rel err = {:.2e} {:}".format(backend, error, status))
+
+def implied_vol_round_trip(size: int = 20000, vol_tol: float = 1e-6):
+    """
+    Vols recovered from closed form prices: every converged vol must lie
+    within `vol_tol` of the true one, including the deep in/out of the
+    money options, and vols outside the search bracket must not converge.
+    Cut short after a few iterations, every vol returned must reprice the
+    option and the others must be NaN.
+    """
+    # the last two are at the money with vols above and below the bracket
+    rng = np.random.default_rng(3)
+    o = black_scholes.option( np.full(size, 100.0)                                      \
+                            , np.append(rng.uniform(30, 300, size - 2), [100.0, 100.0]) \
+                            , np.append(rng.uniform(0.01, 3, size - 2), [1.0, 1.0])     \
+                            , np.append(rng.uniform(0.01, 2, size - 2), [6.0, 5e-5])    \
+                            , rng.uniform(0, 0.1, size)                                 \
+                            , rng.uniform(0, 0.05, size)                                )
+    is_call = rng.random(size) < 0.5
+    prices = black_scholes.greeks(o, ("price",), is_call = is_call)["price"]
+
+    vols, converged = implied_vol(prices, o, is_call, vol_tol = vol_tol)
+    error = np.abs(vols - o.v)[converged].max()
+    outside = not converged[-2:].any()
+    status = "OK" if error < vol_tol and outside else "FAIL"
+    print("Implied vol:\n\tConverged {:.1%}, max vol err = {:.2e} {:}".format(converged.mean(), error, status))
+
+    vols, converged = implied_vol(prices, o, is_call, max_iter = 4)
+    found = ~np.isnan(vols)
+    matched = black_scholes.option(o.S[found], o.K[found], o.T[found], vols[found], o.r[found], o.q[found])
+    error = np.abs(black_scholes.greeks(matched, ("price",), is_call = is_call[found])["price"] - prices[found]).max()
+    status = "OK" if error < 2e-8 and not converged[~found].any() and found.mean() < 1 else "FAIL"
+    print("Implied vol after 4 iterations:\n\tFound {:.1%}, max price err = {:.2e} {:}".format(found.mean(), error, status))
+
+def workspace_allocations(size: int = 10000, scenarios: int = 11, repeat: int = 5, limit: int = 16384):
+    """
+    Repricing through a warm Workspace must not allocate arrays, also when
+    float64 inputs go through a float32 workspace: the traced peak may only
+    grow by the few small dicts of the results. `limit` is a quarter of the
+    casting buffer of a single mixed dtype ufunc and does not grow with the
+    book. A mask flipped in place must be seen by the next reprice, and
+    out= without a workspace must be refused.
+    """
+    rng = np.random.default_rng(0)
+    o = black_scholes.option( rng.uniform(50, 150, (scenarios, size))   \
+                            , rng.uniform(50, 150, size)                \
+                            , rng.uniform(0.05, 2, size)                \
+                            , rng.uniform(0.05, 1, size)                \
+                            , rng.uniform(0, 0.1, size)                 \
+                            , rng.uniform(0, 0.05, size)                )
+    is_call = rng.random(size) < 0.5
+    notional = rng.normal(size = size)
+
+    for precision in black_scholes.PRECISIONS:
+        workspace = black_scholes.Workspace.for_option(o, precision)
+        delta = np.empty(workspace.shape, precision)
+
+        def reprice():
+            black_scholes.greeks(o, notional = notional, is_call = is_call, precision = precision,
+                                 workspace = workspace)
+            black_scholes.call_delta(o, out = delta, workspace = workspace)
+            black_scholes.put_dollar_gamma(notional, o, out = delta, workspace = workspace)
+
+        reprice()
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            for _ in range(repeat):
+                reprice()
+            growth = tracemalloc.get_traced_memory()[1] - start
+        finally:
+            tracemalloc.stop()
+
+        status = "OK" if growth < limit else "FAIL"
+        print("Workspace {:}:\n\tPeak growth over {:} reprices = {:,} bytes {:}".format(precision, repeat, growth,
+                                                                                      status))
+        assert growth < limit, "greeks allocated arrays with a warm {:} Workspace".format(precision)
+
+        np.logical_not(is_call, out = is_call)
+        flipped = black_scholes.greeks(o, ("price",), is_call = is_call, precision = precision, workspace = workspace)
+        reference = black_scholes.greeks(o, ("price",), is_call = is_call, precision = precision)
+        error = np.max(np.abs(flipped["price"] - reference["price"]) / (1 + np.abs(reference["price"])))
+        status = "OK" if error < (1e-12 if precision == "float64" else 1e-5) else "FAIL"
+        print("Workspace {:} mask flipped in place:\n\tMax rel err = {:.2e} {:}".format(precision, error, status))
+
+    for reprice in (lambda: black_scholes.greeks(o, out = {"delta": delta}),
+                    lambda: black_scholes.call_delta(o, out = delta)):
+        try:
+            reprice()
+        except ValueError:
+            continue
+        raise AssertionError("out= without a workspace was accepted")
+    print("Workspace out= without workspace:\n\tRejected OK")
+
+def shared_memory_parity(sizes: tuple = (500, 3000), scenarios: int = 21):
+    """
+    SharedMemoryPricer against black_scholes.greeks, bit for bit, split by
+    options and by scenarios. The second book is larger, so every segment
+    is regrown and the workers must move to the new ones.
+    """
+    rng = np.random.default_rng(4)
+    percentuals = np.linspace(-0.2, 0.2, scenarios)
+    with SharedMemoryPricer(workers = 2) as pricer:
+        for size in sizes:
+            o = black_scholes.option( rng.uniform(50, 150, size)          \
+                                    , rng.uniform(50, 150, size)          \
+                                    , rng.uniform(0.05, 2, size)          \
+                                    , rng.uniform(0.05, 1, size)          \
+                                    , rng.uniform(0, 0.1, size)           \
+                                    , rng.uniform(0, 0.05, size)          )
+            is_call = rng.random(size) < 0.5
+            notional = rng.normal(size = size)
+            grid = black_scholes.option(generate_spot_interval(o.S, percentuals), o.K, o.T, o.v, o.r, o.q)
+            expected = black_scholes.greeks(grid, ("delta", "gamma"), notional, is_call)
+
+            for axis in ("option", "scenario"):
+                result = pricer.price(o, percentuals, ("delta", "gamma"), notional, is_call, axis)
+                same = all(np.array_equal(result[name], expected[name]) for name in expected)
+                status = "OK" if same else "FAIL"
+                print("SharedMemoryPricer {:} options by {:}:\n\tBit for bit {:}".format(size, axis, status))
+
+def monte_carlo_parity(size: int = 100, paths: int = 40000, tol: float = 4.0):
+    """
+    Closed form against an independent simulation: every price must lie
+    within `tol` standard errors of the Monte Carlo estimate. Options no
+    path finishes in the money have no standard error, a 1e-3 floor
+    covers them.
+    """
+    rng = np.random.default_rng(1)
+    o = black_scholes.option( rng.uniform(50, 150, size)    \
+                            , rng.uniform(50, 150, size)    \
+                            , rng.uniform(0.05, 2, size)    \
+                            , rng.uniform(0.05, 1, size)    \
+                            , rng.uniform(0, 0.1, size)     \
+                            , rng.uniform(0, 0.05, size)    )
+    is_call = rng.random(size) < 0.5
+
+    closed_form = black_scholes.greeks(o, ("price",), is_call = is_call)["price"]
+    simulated = monte_carlo_price(o, is_call, paths = paths, control_variate = False)
+    error = np.abs(closed_form - simulated.price) / np.maximum(simulated.stderr, 1e-3)
+    status = "OK" if error.max() < tol else "FAIL"
+    print("Monte Carlo:\n\tMax error = {:.2f} standard errors {:}".format(error.max(), status))
+
+    # the default blocks, and so the RNG streams, must not depend on the threads
+    prices = [monte_carlo_price(o, is_call, payoff = "asian", steps = 4, paths = paths, workers = workers).price
+              for workers in (1, 4)]
+    status = "OK" if np.array_equal(*prices) else "FAIL"
+    print("Monte Carlo 1 and 4 workers:\n\tSame prices {:}".format(status))
+
+def view_sync(size: int = 4):
+    """
+    Views of an OptionArray must follow in-place changes to its buffers.
+    """
+    array = OptionArray(np.arange(size) % 2 == 0, S = np.full(size, 100.0), K = np.linspace(90, 110, size),
+                        T = np.full(size, 0.5), v = np.full(size, 0.2), r = np.full(size, 0.05), q = np.zeros(size))
+    views = list(array)
+    before = [view.delta() for view in views]
+    array.S *= 1.1
+    array.v[:] = 0.3
+
+    error = max(abs(view.delta() - expected) for view, expected in zip(views, array.delta()))
+    moved = all(view.delta() != old for view, old in zip(views, before))
+    status = "OK" if error < 1e-12 and moved else "FAIL"
+    print("OptionArray views after in-place change:\n\tMax abs err = {:.2e} {:}".format(error, status))
+
+def var_chunks(size: int = 200, dates: int = 500, memory_budget: int = 8000, level: float = 0.99):
+    """
+    historical_var with a budget that splits the book into several option
+    blocks against a brute force sort of the fully repriced P&L.
+    """
+    rng = np.random.default_rng(2)
+    codes = rng.integers(0, 3, size).astype(np.int32)
+    spots = np.array([20.0, 5.0, 150.0])[codes]
+    book = OptionBook( spots                                     \
+                     , spots * rng.uniform(0.8, 1.2, size)       \
+                     , rng.uniform(0.05, 2, size)                \
+                     , rng.uniform(0.05, 0.5, size)              \
+                     , rng.uniform(0, 0.1, size)                 \
+                     , rng.uniform(0, 0.05, size)                \
+                     , rng.random(size) < 0.5                    \
+                     , rng.normal(size = size) * 1e6             \
+                     , codes                                     \
+                     , np.array(["A", "B", "C"])                 \
+                     , np.array(["option"] * size)               )
+    returns = rng.normal(0, 0.01, (dates, 3))
+
+    report = historical_var(book, returns, level, memory_budget = memory_budget)
+
+    base = black_scholes.greeks(book, ("price",), book.notional, book.is_call)["dollar_price"]
+    shocked = shocked_book(book, returns[:, codes], 0.0, report.horizon_days)
+    pnl = black_scholes.greeks(shocked, ("price",), book.notional, book.is_call)["dollar_price"] - base
+    losses = np.sort(-pnl.sum(axis = 1))[::-1]
+    count = int(np.ceil((1 - level) * dates - 1e-9))
+
+    error = max(abs(report.var - losses[count - 1]), abs(report.es - losses[:count].mean())) / losses[0]
+    error = max(error, np.abs(report.option_contributions - pnl[report.tail].mean(axis = 0)).max() / losses[0])
+    status = "OK" if error < 1e-12 else "FAIL"
+    blocks = -(-size // (memory_budget // (8 * WORKING_ARRAYS)))
+    print("VaR in {:} option blocks:\n\tMax rel err = {:.2e} {:}".format(blocks, error, status))
+    assert blocks > 1, "the budget must split the book into several option blocks"
+
+def scenario_grid_chunks(size: int = 20, memory_budget: int = 5000):
+    """
+    A (1, options) book split into several option blocks against the same
+    book given flat, and against direct greeks with the floored vols. The
+    vol axis shocks every option below zero vol, which must stay finite.
+    """
+    rng = np.random.default_rng(4)
+    flat = black_scholes.option( rng.uniform(50, 150, size)    \
+                               , rng.uniform(50, 150, size)    \
+                               , rng.uniform(0.05, 2, size)    \
+                               , rng.uniform(0.05, 1, size)    \
+                               , rng.uniform(0, 0.1, size)     \
+                               , rng.uniform(0, 0.05, size)    )
+    rows = black_scholes.option(*(getattr(flat, name)[np.newaxis] for name in "SKTvrq"))
+    is_call = rng.random(size) < 0.5
+    axes = {"spot": [-0.1, 0.0, 0.1], "vol": [-1.0, 0.0, 0.1]}
+
+    grid = scenario_grid(rows, axes, is_call = is_call, memory_budget = memory_budget).greeks
+    reference = scenario_grid(flat, axes, is_call = is_call).greeks
+    error = max(np.abs(grid[k] - reference[k]).max() for k in reference)
+
+    for i, x in enumerate(axes["spot"]):
+        for j, dv in enumerate(axes["vol"]):
+            shocked = black_scholes.option(flat.S * (1 + x), flat.K, flat.T, np.maximum(flat.v + dv, MIN_VOL), flat.r, flat.q)
+            direct = black_scholes.greeks(shocked, ("delta", "gamma"), is_call = is_call)
+            error = max(error, max(np.abs(grid[k][i, j] - direct[k]).max() for k in direct))
+
+    finite = all(np.isfinite(g).all() for g in grid.values())
+    status = "OK" if error < 1e-12 and finite else "FAIL"
+    print("Scenario grid by option blocks:\n\tMax abs err = {:.2e} {:}".format(error, status))
+
 def main():
     CALL_TESTS = { 'price' : call_price_test   \
                  , 'delta' : call_delta_test   \
@@ -158,5 +530,27 @@ def main():
     run_tests(CALL_TESTS, Call)
     print("-----------------")
     run_tests(PUT_TESTS, Put)
+    print("-----------------")
+    theta_closed_form()
+    print("-----------------")
+    masked_parity()
+    print("-----------------")
+    higher_order_differences()
+    print("-----------------")
+    backend_parity()
+    print("-----------------")
+    implied_vol_round_trip()
+    print("-----------------")
+    workspace_allocations()
+    print("-----------------")
+    shared_memory_parity()
+    print("-----------------")
+    monte_carlo_parity()
+    print("-----------------")
+    view_sync()
+    print("-----------------")
+    var_chunks()
+    print("-----------------")
+    scenario_grid_chunks()
 
 if __name__ == "__main__": main()
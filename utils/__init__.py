@@ -1 +1 @@
-__all__ = ["dates", "data_handling", "Option","tables"]
+__all__ = ["dates", "data_handling", "Option","tables", "implied_vol", "book", "normal", "backends", "scenarios", "pipeline", "parallel", "cache", "writers", "profiling", "aggregate", "proxy", "var", "montecarlo"]
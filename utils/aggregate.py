@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+from utils.book import OptionBook
+from utils.data_handling import generate_spot_interval
+from utils.scenarios import DEFAULT_MEMORY_BUDGET, WORKING_ARRAYS, chunk_slices
+
+@dataclass
+class BookAggregate:
+    """
+    Dollar greeks summed per spot scenario. `by_underlying[greek]` has
+    shape (scenarios, underlyings) with columns in `names` order and
+    `totals[greek]` is the whole book, shape (scenarios,).
+    `per_option[greek]` is the (scenarios, options) matrix, only kept when
+    asked for.
+    """
+    names: np.ndarray
+    percentuals: np.ndarray
+    by_underlying: dict
+    totals: dict
+    per_option: dict = None
+
+def reduce_by_code(values: np.ndarray, codes: np.ndarray, n_groups: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Sums the (scenarios, options) values over the options sharing a code,
+    giving (scenarios, n_groups). Accumulates into `out` when given.
+    """
+    if out is None:
+        out = np.zeros((values.shape[0], n_groups))
+    for row, sums in zip(values, out):
+        sums += np.bincount(codes, weights = row, minlength = n_groups)
+    return out
+
+def aggregate_book(book: OptionBook,
+                   percentuals: np.ndarray,
+                   which: tuple = ("delta", "gamma"),
+                   keep_options: bool = False,
+                   memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                   backend: str = None,
+                   precision: str = "float64") -> BookAggregate:
+    """
+    Prices the book over the spot ladder and reduces the signed dollar
+    greeks per underlying, one block of options at a time, so only a
+    block's worth of per-option greeks is ever alive unless
+    `keep_options` asks for the full matrix. `book.S` holds the spots,
+    not the ladder. `precision` applies to the per-option greeks, the sums
+    are always accumulated in float64.
+    """
+    n_scenarios, n_options, n_groups = len(percentuals), len(book), len(book.names)
+    by_underlying = {name: np.zeros((n_scenarios, n_groups)) for name in which}
+    per_option = {name: np.empty((n_scenarios, n_options), dtype = precision) for name in which} \
+                 if keep_options else None
+
+    cell_bytes = np.dtype(precision).itemsize * 2 * len(which) + 8 * WORKING_ARRAYS
+    options_per_chunk = max(1, memory_budget // (cell_bytes * n_scenarios))
+
+    for part in chunk_slices(n_options, options_per_chunk):
+        chunk = option(generate_spot_interval(book.S[part], percentuals),
+                       book.K[part], book.T[part], book.v[part], book.r[part], book.q[part])
+        greeks = black_scholes.greeks(chunk, which, book.notional[part], book.is_call[part], backend, precision)
+
+        for name in which:
+            dollar = greeks["dollar_" + name]
+            reduce_by_code(dollar, book.codes[part], n_groups, by_underlying[name])
+            if keep_options:
+                per_option[name][:, part] = dollar
+
+    totals = {name: sums.sum(axis = 1) for name, sums in by_underlying.items()}
+    return BookAggregate(book.names, percentuals, by_underlying, totals, per_option)
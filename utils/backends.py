@@ -0,0 +1,144 @@
+import os
+import math
+import warnings
+
+import numpy as np
+
+from utils import normal
+
+KNOWN_BACKENDS = ("numpy", "numexpr", "numba")
+BACKEND_ENVIRONMENT_VARIABLE = "BLACK_SCHOLES_BACKEND"
+
+BACKENDS = dict()
+LOADERS = dict()
+default_backend = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE, "numpy")
+
+def register(name: str, kernel) -> None:
+    """
+    A kernel takes (o, which, is_call) and returns a dict with the plain
+    greeks in `which`, with the conventions of black_scholes.greeks.
+    """
+    BACKENDS[name] = kernel
+
+def register_lazy(name: str, loader) -> None:
+    """
+    `loader()` imports the optional dependency and returns the kernel, or
+    raises ImportError. It only runs the first time `name` is requested,
+    so importing this module never pays for numexpr or numba.
+    """
+    LOADERS[name] = loader
+
+def load(name: str) -> bool:
+    if name not in BACKENDS and name in LOADERS:
+        try:
+            register(name, LOADERS.pop(name)())
+        except ImportError:
+            pass
+    return name in BACKENDS
+
+def available() -> list:
+    return [name for name in dict.fromkeys(KNOWN_BACKENDS + tuple(LOADERS)) if load(name)]
+
+def set_default(name: str) -> None:
+    global default_backend
+    default_backend = name
+
+def get(name: str = None):
+    name = name or default_backend
+
+    if load(name):
+        return BACKENDS[name]
+
+    if name not in KNOWN_BACKENDS:
+        raise ValueError("unknown backend {:}, expected one of {:}".format(name, KNOWN_BACKENDS))
+
+    warnings.warn("backend {:} is not installed, falling back to numpy".format(name))
+    return BACKENDS["numpy"]
+
+# bound by load_numba(), the numba kernel resolves numba.prange through it
+numba = None
+
+def numexpr_greeks(o, which: tuple, is_call) -> dict:
+    """
+    Each expression is evaluated by numexpr in one multithreaded pass with
+    no intermediate temporaries. The normal cdf is not a numexpr function,
+    so it goes through utils.normal.
+    """
+    import numexpr
+
+    local = { "S" : o.S, "K" : o.K, "T" : o.T, "v" : o.v, "r" : o.r, "q" : o.q \
+            , "cp"   : np.where(is_call, 1.0, -1.0)                           }
+
+    local["den"] = numexpr.evaluate("v * sqrt(T)", local_dict = local)
+    local["d1"]  = numexpr.evaluate("(log(S / K) + (r - q + v * v / 2) * T) / den", local_dict = local)
+    local["d2"]  = numexpr.evaluate("d1 - den", local_dict = local)
+    local["qd"]  = numexpr.evaluate("exp(-q * T)", local_dict = local)
+    local["rd"]  = numexpr.evaluate("exp(-r * T)", local_dict = local)
+
+    if {"price", "delta", "theta", "rho"}.intersection(which):
+        local["Nd1"] = normal.cdf(numexpr.evaluate("cp * d1", local_dict = local))
+        local["Nd2"] = normal.cdf(numexpr.evaluate("cp * d2", local_dict = local))
+    if {"gamma", "theta", "vega"}.intersection(which):
+        local["sn"] = numexpr.evaluate("S * qd * exp(-0.5 * d1 * d1) / sqrt(2 * {:})".format(math.pi), local_dict = local)
+
+    expressions = { "price" : "cp * (S * qd * Nd1 - K * rd * Nd2)"                                     \
+                  , "delta" : "cp * qd * Nd1"                                                          \
+                  , "gamma" : "sn / (S * S * den)"                                                       \
+                  , "theta" : "(- sn * v / (2 * sqrt(T)) - cp * r * K * rd * Nd2 + cp * q * S * qd * Nd1) / 100" \
+                  , "vega"  : "sn * sqrt(T) / 100"                                                       \
+                  , "rho"   : "cp * K * rd * Nd2 / 100"                                                }
+
+    return {name: numexpr.evaluate(expressions[name], local_dict = local) for name in which}
+
+def numba_loop(S, K, T, v, r, q, sign, out):
+    for i in numba.prange(S.size):
+        sqrt_T = math.sqrt(T[i])
+        denominator = v[i] * sqrt_T
+        d1 = (math.log(S[i] / K[i]) + (r[i] - q[i] + v[i] * v[i] / 2) * T[i]) / denominator
+        d2 = d1 - denominator
+
+        q_discount = math.exp(-q[i] * T[i])
+        r_discount = math.exp(-r[i] * T[i])
+
+        cdf_d1 = 0.5 * math.erfc(- sign[i] * d1 / math.sqrt(2.0))
+        cdf_d2 = 0.5 * math.erfc(- sign[i] * d2 / math.sqrt(2.0))
+        spot_pdf = S[i] * q_discount * math.exp(-0.5 * d1 * d1) / math.sqrt(2 * math.pi)
+
+        out[0, i] = sign[i] * (S[i] * q_discount * cdf_d1 - K[i] * r_discount * cdf_d2)
+        out[1, i] = sign[i] * q_discount * cdf_d1
+        out[2, i] = spot_pdf / (S[i] * S[i] * denominator)
+        out[3, i] = (- spot_pdf * v[i] / (2 * sqrt_T)                   \
+                     - sign[i] * r[i] * K[i] * r_discount * cdf_d2      \
+                     + sign[i] * q[i] * S[i] * q_discount * cdf_d1) / 100
+        out[4, i] = spot_pdf * sqrt_T / 100
+        out[5, i] = sign[i] * K[i] * r_discount * cdf_d2 / 100
+
+def numba_greeks(o, which: tuple, is_call) -> dict:
+    """
+    Fused loop compiled with numba, split across cores with prange. Every
+    greek is produced in the same pass and only `which` is returned.
+    """
+    sign = np.where(is_call, 1.0, -1.0)
+    columns = np.broadcast_arrays(o.S, o.K, o.T, o.v, o.r, o.q, sign)
+    shape = columns[0].shape
+    flat = [np.ascontiguousarray(x, dtype = np.float64).ravel() for x in columns]
+
+    out = np.empty((6, flat[0].size))
+    numba_greeks.kernel(*flat, out)
+
+    order = ("price", "delta", "gamma", "theta", "vega", "rho")
+    return {name: out[order.index(name)].reshape(shape) for name in which}
+
+def load_numexpr():
+    import numexpr
+    return numexpr_greeks
+
+def load_numba():
+    global numba
+    import numba
+
+    numba_greeks.kernel = numba.njit(parallel = True, cache = True)(numba_loop)
+    return numba_greeks
+
+register_lazy("numexpr", load_numexpr)
+register_lazy("numba", load_numba)
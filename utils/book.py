@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from black_scholes import option
+
+@dataclass
+class OptionBook(option):
+    """
+    Struct-of-arrays view of a mixed call/put portfolio.
+
+    Extends `option` with the columns needed to price the whole book in
+    one call: `is_call` is the put-call mask, `notional` is already signed
+    by direction, `codes` index into `names` (the underlyings) and
+    `labels` keeps the "ativo-call_put-direction" row labels in input order.
+    """
+    is_call: np.ndarray
+    notional: np.ndarray
+    codes: np.ndarray
+    names: np.ndarray
+    labels: np.ndarray
+
+    def __len__(self) -> int:
+        return self.K.shape[-1]
+
+def column(data, name: str) -> np.ndarray:
+    return np.ascontiguousarray(np.asarray(data[name], dtype = np.float64))
+
+def labels_column(data, name: str) -> np.ndarray:
+    return np.asarray(data[name]).astype(str)
+
+def book_from_columns(data) -> OptionBook:
+    """
+    Builds the book from anything indexable by column name: a DataFrame,
+    a structured (possibly memory-mapped) array or an npz file.
+    """
+    ativo     = labels_column(data, "ativo")
+    call_put  = labels_column(data, "call_put")
+    direction = labels_column(data, "direction")
+
+    names, codes = np.unique(ativo, return_inverse = True)
+    sign = np.where(direction == "Sell", -1.0, 1.0)
+    labels = np.char.add(np.char.add(np.char.add(ativo, "-"), np.char.add(call_put, "-")), direction)
+
+    return OptionBook( column(data, "spot")                   \
+                     , column(data, "strike")                 \
+                     , column(data, "tenor") / 365            \
+                     , column(data, "vol")                    \
+                     , column(data, "r_d")                    \
+                     , column(data, "r_f")                    \
+                     , call_put == "Call"                     \
+                     , column(data, "notional") * sign        \
+                     , codes.astype(np.int32)                 \
+                     , names                                  \
+                     , labels                                 \
+    )
+
+def book_from_dataframe(data: pd.DataFrame) -> OptionBook:
+    return book_from_columns(data)
+
+def book_greek_to_dataframe(greek: np.ndarray, book: OptionBook, colnames: list) -> pd.DataFrame:
+    """
+    (scenarios, options) greek matrix as an (options, scenarios) table in
+    the book's row order.
+    """
+    return pd.DataFrame(greek.T, index = book.labels, columns = colnames)
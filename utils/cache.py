@@ -0,0 +1,86 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from utils.book import OptionBook
+
+# bump whenever parsing or OptionBook construction changes meaning
+PARSER_VERSION = 1
+
+CACHE_ENVIRONMENT_VARIABLE = "BLACK_SCHOLES_CACHE"
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "black_scholes")
+DEFAULT_MAX_BYTES = 2 * 2**30
+
+BOOK_FIELDS = ("S", "K", "T", "v", "r", "q", "is_call", "notional", "codes", "names", "labels")
+
+def cache_directory() -> str:
+    return os.environ.get(CACHE_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIRECTORY)
+
+def file_key(file: str) -> str:
+    digest = hashlib.sha256("parser-{:}".format(PARSER_VERSION).encode())
+    with open(file, "rb") as handle:
+        for block in iter(lambda: handle.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def entry_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+
+def load_entry(path: str) -> OptionBook:
+    columns = [np.load(os.path.join(path, name + ".npy"), mmap_mode = "r") for name in BOOK_FIELDS]
+    os.utime(path)
+    return OptionBook(*columns)
+
+def store_entry(path: str, book: OptionBook) -> None:
+    root = os.path.dirname(path)
+    os.makedirs(root, exist_ok = True)
+
+    staging = tempfile.mkdtemp(dir = root, prefix = ".staging-")
+    for name in BOOK_FIELDS:
+        np.save(os.path.join(staging, name + ".npy"), np.ascontiguousarray(getattr(book, name)))
+
+    try:
+        os.replace(staging, path)
+    except OSError:
+        # another run stored the same key first
+        shutil.rmtree(staging, ignore_errors = True)
+
+def evict(max_bytes: int, directory: str = None) -> None:
+    """
+    Removes the least recently used entries until the cache fits in
+    `max_bytes`. Entries are touched on every hit.
+    """
+    directory = directory or cache_directory()
+    if not os.path.isdir(directory):
+        return
+
+    entries = [os.path.join(directory, x) for x in os.listdir(directory) if not x.startswith(".")]
+    entries.sort(key = os.path.getmtime, reverse = True)
+
+    total = 0
+    for path in entries:
+        total += entry_size(path)
+        if total > max_bytes:
+            shutil.rmtree(path, ignore_errors = True)
+
+def clear(directory: str = None) -> None:
+    shutil.rmtree(directory or cache_directory(), ignore_errors = True)
+
+def cached_book(file: str, loader, max_bytes: int = DEFAULT_MAX_BYTES) -> OptionBook:
+    """
+    Returns the OptionBook for `file`, parsed by `loader(file)` only when
+    no entry exists for the file's content hash and PARSER_VERSION. The
+    columns are stored as .npy files and come back memory-mapped.
+    """
+    path = os.path.join(cache_directory(), file_key(file))
+    if os.path.isdir(path):
+        return load_entry(path)
+
+    book = loader(file)
+    store_entry(path, book)
+    evict(max_bytes)
+
+    return load_entry(path) if os.path.isdir(path) else book
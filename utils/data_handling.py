@@ -56,30 +56,111 @@ def add_fake_callput(table: pd.DataFrame) -> pd.DataFrame:
     fake_table = pd.concat([table, fake], ignore_index = True) 
     return fake_table
 
-def fetch_data_from_pickle(pickle_file: str) -> tuple:
-   
-    raw_data = pd.read_pickle(pickle_file)
-    
-    if not must_have_columns.issubset(raw_data):
+column_dtypes = { "ativo"     : str          \
+                , "call_put"  : str          \
+                , "direction" : str          \
+                , "tenor"     : np.float64   \
+                , "spot"      : np.float64   \
+                , "strike"    : np.float64   \
+                , "forward"   : np.float64   \
+                , "notional"  : np.float64   \
+                , "vol"       : np.float64   \
+                , "r_d"       : np.float64   \
+                , "r_f"       : np.float64   \
+}
+
+def column_names(raw_data) -> set:
+    if isinstance(raw_data, np.ndarray):
+        return set(raw_data.dtype.names or ())
+    return set(raw_data)
+
+def check_columns(raw_data: pd.DataFrame) -> pd.DataFrame:
+    if not must_have_columns.issubset(column_names(raw_data)):
         print("ERROR: Expected column names:")
         print(must_have_columns)
         sys.exit(1)
 
-    complete_data = add_fake_callput(raw_data)
+    return raw_data
+
+def read_data_from_pickle(pickle_file: str) -> pd.DataFrame:
+    return check_columns(pd.read_pickle(pickle_file))
+
+def read_data_from_excel(xlsx_file: str) -> pd.DataFrame:
+    return check_columns(pd.read_excel(xlsx_file, engine = "openpyxl"))
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        print("ERROR: Reading parquet/arrow files requires pyarrow")
+        sys.exit(1)
+
+def arrow_table_to_dataframe(table) -> pd.DataFrame:
+    data = table.to_pandas()
+    return data.astype({k: column_dtypes[k] for k in must_have_columns if column_dtypes[k] is not str})
+
+def read_data_from_parquet(parquet_file: str) -> pd.DataFrame:
+    """
+    Reads only the must_have_columns fields, memory-mapping the file.
+    """
+    import_pyarrow()
+    import pyarrow.parquet
+
+    schema = pyarrow.parquet.read_schema(parquet_file)
+    check_columns(schema.names)
+
+    table = pyarrow.parquet.read_table(parquet_file, columns = sorted(must_have_columns), memory_map = True)
+    return arrow_table_to_dataframe(table)
+
+def read_data_from_arrow(arrow_file: str) -> pd.DataFrame:
+    """
+    Reads an Arrow IPC (feather v2) file through a memory map, loading
+    only the must_have_columns fields.
+    """
+    import_pyarrow()
+    import pyarrow.feather
+
+    table = pyarrow.feather.read_table(arrow_file, memory_map = True)
+    check_columns(table.column_names)
+    return arrow_table_to_dataframe(table.select(sorted(must_have_columns)))
+
+def read_data_from_numpy(numpy_file: str):
+    """
+    .npy holds a structured array and is memory-mapped read only, so the
+    float columns are paged in as they are priced. .npz holds one array
+    per column; only the must_have_columns are decompressed, once each.
+    """
+    if numpy_file.endswith(".npy"):
+        return check_columns(np.load(numpy_file, mmap_mode = "r"))
+    with np.load(numpy_file) as archive:
+        check_columns(archive.files)
+        return {name: archive[name] for name in must_have_columns}
+
+def save_data_to_numpy(data: pd.DataFrame, numpy_file: str) -> None:
+    """
+    Writes the must_have_columns of `data` as a structured .npy array with
+    fixed dtypes, the layout read_data_from_numpy memory-maps.
+    """
+    check_columns(data)
+    columns = {name: data[name].to_numpy(dtype = column_dtypes[name]) for name in sorted(must_have_columns)}
+
+    structured = np.empty(len(data), dtype = [(name, x.dtype) for name, x in columns.items()])
+    for name, values in columns.items():
+        structured[name] = values
+
+    np.save(numpy_file, structured)
+
+def fetch_data_from_pickle(pickle_file: str) -> tuple:
+   
+    complete_data = add_fake_callput(read_data_from_pickle(pickle_file))
     splited_data  = split_bygroup(complete_data, "call_put")
 
     return splited_data[0], splited_data[1]
 
 def fetch_data_from_excel(xlsx_file: str) -> tuple:
    
-    raw_data = pd.read_excel(xlsx_file, engine = "openpyxl")
-
-    if not must_have_columns.issubset(raw_data):
-        print("ERROR: Expected column names:")
-        print(must_have_columns)
-        sys.exit(1)
-
-    complete_data = add_fake_callput(raw_data)
+    complete_data = add_fake_callput(read_data_from_excel(xlsx_file))
     splited_data = split_bygroup(complete_data, "call_put")
 
     return splited_data[0], splited_data[1]
@@ -95,6 +176,9 @@ def generate_spot_interval(spots: np.ndarray, percentuals: np.ndarray) -> np.nda
     """
     return spots + np.outer(percentuals, spots)
 
+def scenario_column_names(greek: str, percentuals: np.ndarray) -> list:
+    return ["{:} {:}%".format(greek, int(100 * x)) for x in percentuals]
+
 def make_forward(o: option) -> np.ndarray:
     return o.S * np.exp(- o.r * o.T)
 
@@ -0,0 +1,109 @@
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+
+VOL_LOWER_BOUND = 1e-4
+VOL_UPPER_BOUND = 5.0
+
+def as_call_prices(prices: np.ndarray, o: option, is_call) -> np.ndarray:
+    """
+    Maps put prices to call prices through put-call parity so a mixed
+    book can be solved as calls only. Vega is the same for both legs.
+    """
+    parity = o.S * np.exp(-o.q * o.T) - o.K * np.exp(-o.r * o.T)
+    return np.where(is_call, prices, prices + parity)
+
+def initial_guess(call_prices: np.ndarray, o: option) -> np.ndarray:
+    """
+    Corrado-Miller rational approximation of the volatility, clipped to
+    the search bracket.
+    """
+    forward_spot = o.S * np.exp(-o.q * o.T)
+    discounted_strike = o.K * np.exp(-o.r * o.T)
+
+    moneyness = (forward_spot - discounted_strike) / 2
+    excess = call_prices - moneyness
+    radicand = np.maximum(excess * excess - moneyness * moneyness * 4 / np.pi, 0)
+
+    total_vol = np.sqrt(2 * np.pi) / (forward_spot + discounted_strike) * (excess + np.sqrt(radicand))
+    guess = total_vol / np.sqrt(o.T)
+
+    return np.clip(np.nan_to_num(guess, nan = 0.2), VOL_LOWER_BOUND, VOL_UPPER_BOUND)
+
+def implied_vol(prices: np.ndarray, 
+                o: option, 
+                is_call = True, 
+                tol: float = 1e-8, 
+                vol_tol: float = 1e-6, 
+                max_iter: int = 100) -> tuple:
+    """
+    Batched implied volatility for calls and puts.
+
+    Runs Newton on vega and falls back to bisection whenever the Newton
+    step leaves the current [lower, upper] bracket. Elements are dropped
+    from the working set as soon as they converge, so later iterations
+    only price what is left. `o.v` is ignored.
+
+    An element stops once its price is within `tol` of the target. It
+    has converged only if vega is large enough for `tol` to pin the
+    volatility within `vol_tol`; deep in/out of the money options with
+    vanishing vega match any volatility in a wide range and are returned
+    with converged = False.
+
+    Returns (vols, converged). Prices outside the no-arbitrage bounds, and
+    prices whose bracket closes below `vol_tol` without matching them (a
+    volatility outside [VOL_LOWER_BOUND, VOL_UPPER_BOUND]), are reported
+    as NaN with converged = False, and so are elements still unmatched
+    after `max_iter` iterations.
+    """
+    S, K, T, r, q, prices, is_call = np.broadcast_arrays(o.S, o.K, o.T, o.r, o.q, prices, is_call)
+    shape = S.shape
+    S, K, T, r, q = [np.asarray(x, dtype = np.float64).ravel() for x in (S, K, T, r, q)]
+    prices = np.asarray(prices, dtype = np.float64).ravel()
+
+    book = option(S, K, T, np.zeros_like(S), r, q)
+    targets = as_call_prices(prices, book, is_call.ravel())
+
+    forward_spot = S * np.exp(-q * T)
+    lower_price = np.maximum(forward_spot - K * np.exp(-r * T), 0)
+    valid = (targets >= lower_price) & (targets <= forward_spot) & (T > 0)
+
+    vols = np.full(S.shape, np.nan)
+    converged = np.zeros(S.shape, dtype = bool)
+
+    active = np.flatnonzero(valid)
+    lower = np.full(active.shape, VOL_LOWER_BOUND)
+    upper = np.full(active.shape, VOL_UPPER_BOUND)
+    current = initial_guess(targets[active], option(S[active], K[active], T[active], None, r[active], q[active]))
+
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+
+        sub = option(S[active], K[active], T[active], current, r[active], q[active])
+        g = black_scholes.greeks(sub, ("price", "vega"))
+        diff = g["price"] - targets[active]
+        vega = g["vega"] * 100
+
+        lower = np.where(diff < 0, current, lower)
+        upper = np.where(diff > 0, current, upper)
+
+        # within tol of the target price, and tol can only be met by
+        # volatilities within vol_tol of each other
+        matched = np.abs(diff) < tol
+        pinned = matched & (vega * vol_tol > tol)
+        collapsed = upper - lower < vol_tol
+        vols[active[matched]] = current[matched]
+        converged[active[pinned]] = True
+        done = matched | collapsed
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            newton = current - diff / vega
+        outside = ~np.isfinite(newton) | (newton <= lower) | (newton >= upper)
+        step = np.where(outside, (lower + upper) / 2, newton)
+
+        keep = ~done
+        active, lower, upper, current = active[keep], lower[keep], upper[keep], step[keep]
+
+    return vols.reshape(shape), converged.reshape(shape)
@@ -0,0 +1,192 @@
+import os
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+from utils.scenarios import DEFAULT_MEMORY_BUDGET
+
+PAYOFFS = ("european", "asian", "up-and-out", "down-and-out", "up-and-in", "down-and-in")
+
+# (paths, options) arrays alive at once in a block: spot, normals, running
+# sum/extreme, payoff, control and temporaries
+BLOCK_ARRAYS = 8
+
+# blocks the memory budget is split between when block_size is derived;
+# no more blocks than the budget holds run at once, whatever the workers
+BLOCKS_IN_FLIGHT = 8
+
+@dataclass
+class Moments:
+    """
+    Running count, means, second moments and comoment of the payoff Y and
+    the control C, one entry per option. Blocks are merged with Chan's
+    pairwise update so only these arrays are ever kept.
+    """
+    count: int
+    mean_y: np.ndarray
+    mean_c: np.ndarray
+    m2_y: np.ndarray
+    m2_c: np.ndarray
+    c_yc: np.ndarray
+
+    @staticmethod
+    def of(y: np.ndarray, c: np.ndarray) -> "Moments":
+        mean_y, mean_c = y.mean(axis = 0), c.mean(axis = 0)
+        dy, dc = y - mean_y, c - mean_c
+        return Moments(len(y), mean_y, mean_c, (dy * dy).sum(axis = 0), (dc * dc).sum(axis = 0), (dy * dc).sum(axis = 0))
+
+    def merge(self, other: "Moments") -> "Moments":
+        count = self.count + other.count
+        weight = self.count * other.count / count
+        dy, dc = other.mean_y - self.mean_y, other.mean_c - self.mean_c
+        return Moments( count                                                       \
+                      , self.mean_y + dy * other.count / count                      \
+                      , self.mean_c + dc * other.count / count                      \
+                      , self.m2_y + other.m2_y + dy * dy * weight                   \
+                      , self.m2_c + other.m2_c + dc * dc * weight                   \
+                      , self.c_yc + other.c_yc + dy * dc * weight                   )
+
+@dataclass
+class MonteCarloResult:
+    """
+    Prices and their standard errors per option. `beta` is the control
+    variate coefficient (zero without control) and `samples` the number of
+    independent samples, i.e. path pairs when antithetic.
+    """
+    price: np.ndarray
+    stderr: np.ndarray
+    beta: np.ndarray
+    samples: int
+
+def block_sizes(paths: int, block_size: int) -> list:
+    return [min(block_size, paths - start) for start in range(0, paths, block_size)]
+
+def simulate_block(o: option,
+                   sign: np.ndarray,
+                   payoff: str,
+                   barrier: np.ndarray,
+                   steps: int,
+                   paths: int,
+                   antithetic: bool,
+                   seed: np.random.SeedSequence) -> Moments:
+    """
+    One block of GBM paths from its own RNG stream. Returns the moments of
+    the discounted payoff and of the discounted European payoff of the
+    same paths, the control.
+    """
+    rng = np.random.Generator(np.random.PCG64(seed))
+    draws = (paths + 1) // 2 if antithetic else paths
+    rows = 2 * draws if antithetic else draws
+
+    dt = o.T / steps
+    drift = (o.r - o.q - o.v * o.v / 2) * dt
+    diffusion = o.v * np.sqrt(dt)
+
+    S = np.repeat(np.broadcast_to(o.S, o.K.shape)[np.newaxis], rows, axis = 0)
+    running = np.zeros_like(S) if payoff == "asian" else S.copy() if payoff != "european" else None
+    for _ in range(steps):
+        Z = rng.standard_normal((draws,) + o.K.shape)
+        if antithetic:
+            Z = np.concatenate((Z, -Z))
+        S *= np.exp(drift + diffusion * Z)
+
+        if payoff == "asian":
+            running += S
+        elif payoff.startswith("up"):
+            np.maximum(running, S, out = running)
+        elif payoff.startswith("down"):
+            np.minimum(running, S, out = running)
+
+    discount = np.exp(-o.r * o.T)
+    control = discount * np.maximum(sign * (S - o.K), 0)
+    if payoff == "european":
+        value = control
+    elif payoff == "asian":
+        value = discount * np.maximum(sign * (running / steps - o.K), 0)
+    else:
+        crossed = running >= barrier if payoff.startswith("up") else running <= barrier
+        alive = ~crossed if payoff.endswith("out") else crossed
+        value = control * alive
+
+    if antithetic:
+        value = (value[:draws] + value[draws:]) / 2
+        control = (control[:draws] + control[draws:]) / 2
+
+    return Moments.of(value, control)
+
+def monte_carlo_price(o: option,
+                      is_call = True,
+                      payoff: str = "european",
+                      barrier: np.ndarray = None,
+                      steps: int = 1,
+                      paths: int = 100_000,
+                      seed: int = 0,
+                      antithetic: bool = True,
+                      control_variate: bool = True,
+                      block_size: int = None,
+                      workers: int = None,
+                      memory_budget: int = DEFAULT_MEMORY_BUDGET) -> MonteCarloResult:
+    """
+    Prices every option of `o` (S, K, T, v, r, q arrays) by simulating GBM
+    paths with `steps` equally spaced monitoring dates over its own T.
+
+    `payoff` is one of PAYOFFS: "asian" averages the monitored spots
+    (arithmetic, S0 excluded) and the barrier payoffs knock in or out on
+    the monitored spots against `barrier`. The paths are simulated in
+    blocks of `block_size` (when None, `memory_budget` split between
+    BLOCKS_IN_FLIGHT blocks), each with its own RNG stream spawned from
+    `seed`, and the blocks run on `workers` threads (one per CPU when
+    None), never more than the budget holds. Results depend on seed,
+    paths and block_size but not on the number of workers or the host.
+
+    With `control_variate` the discounted European payoff of the same
+    paths is the control and its closed-form price from black_scholes the
+    known mean. For "european" this returns the closed form itself, so
+    turn it off to validate the closed form.
+    """
+    if payoff not in PAYOFFS:
+        raise ValueError("unknown payoff: {:}, expected one of {:}".format(payoff, PAYOFFS))
+    if payoff not in ("european", "asian") and barrier is None:
+        raise ValueError("{:} needs a barrier".format(payoff))
+
+    fields = np.broadcast_arrays(*(np.asarray(getattr(o, name), dtype = np.float64) for name in "SKTvrq"))
+    o = option(*(np.atleast_1d(x) for x in fields))
+    n_options = o.K.shape[-1]
+    sign = np.where(np.broadcast_to(is_call, o.K.shape), 1.0, -1.0)
+    barrier = None if barrier is None else np.broadcast_to(np.asarray(barrier, dtype = np.float64), o.K.shape)
+
+    path_bytes = 8 * BLOCK_ARRAYS * n_options
+    if block_size is None:
+        block_size = max(2, memory_budget // (path_bytes * BLOCKS_IN_FLIGHT))
+    block_size += block_size % 2 if antithetic else 0
+    sizes = block_sizes(paths, block_size)
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    in_flight = max(1, memory_budget // (path_bytes * block_size))
+    workers = min(workers if workers is not None else os.cpu_count() or 1, in_flight, len(sizes))
+
+    def run(index: int) -> Moments:
+        return simulate_block(o, sign, payoff, barrier, steps, sizes[index], antithetic, streams[index])
+
+    # merged in block order, so the sums do not depend on scheduling
+    with ThreadPoolExecutor(max_workers = max(1, workers)) as executor:
+        moments = None
+        for block in executor.map(run, range(len(sizes))):
+            moments = block if moments is None else moments.merge(block)
+
+    n = moments.count
+    var_y = moments.m2_y / (n - 1)
+    if not control_variate:
+        return MonteCarloResult(moments.mean_y, np.sqrt(var_y / n), np.zeros(n_options), n)
+
+    closed_form = black_scholes.greeks(o, ("price",), is_call = sign > 0)["price"]
+    var_c = moments.m2_c / (n - 1)
+    cov = moments.c_yc / (n - 1)
+    beta = np.divide(cov, var_c, out = np.zeros(n_options), where = var_c > 0)
+
+    price = moments.mean_y - beta * (moments.mean_c - closed_form)
+    residual = np.maximum(var_y - beta * cov, 0)
+    return MonteCarloResult(price, np.sqrt(residual / n), beta, n)
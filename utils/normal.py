@@ -0,0 +1,25 @@
+# Standard normal cdf/pdf on ufunc primitives, without the scipy.stats
+# rv_continuous argument checking.
+import numpy as np
+
+INV_SQRT_2PI = 1 / np.sqrt(2 * np.pi)
+
+# scipy.special is imported on the first cdf call, not at startup
+ndtr = None
+
+def cdf(x: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    global ndtr
+    if ndtr is None:
+        from scipy.special import ndtr
+
+    return ndtr(x, out = out) if out is not None else ndtr(x)
+
+def pdf(x: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    if out is None:
+        return INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+    np.multiply(x, x, out = out)
+    np.multiply(out, -0.5, out = out)
+    np.exp(out, out = out)
+    np.multiply(out, INV_SQRT_2PI, out = out)
+    return out
@@ -1,18 +1,31 @@
 from __future__ import annotations
 
 import numpy as np
-from scipy.stats import norm
+from utils import normal
 
 class Call: 
     RHO_NORMALIZATION   = 1 / 100
     VEGA_NORMALIZATION  = 1 / 100
     THETA_NORMALIZATION = 1 / 252
 
-    __slots__ = ('S', 'K', 'T', 'v', 'r', 'q')
+    # everything but S enters the spot independent terms
+    SPOT_INDEPENDENT = frozenset(('K', 'T', 'v', 'r', 'q'))
+    # puts evaluate the normal cdf at -d1, -d2
+    SIGN = 1
+
+    __slots__ = ('S', 'K', 'T', 'v', 'r', 'q', '_terms', '_normals')
     def __init__(self, **kwargs):
+        object.__setattr__(self, '_terms', None)
+        object.__setattr__(self, '_normals', None)
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    def __setattr__(self: Call, key: str, value) -> None:
+        object.__setattr__(self, key, value)
+        object.__setattr__(self, '_normals', None)
+        if key in Call.SPOT_INDEPENDENT:
+            object.__setattr__(self, '_terms', None)
+
     def update_spot(self: Call, S: float) -> Call: 
         self.S = S
         return self 
@@ -21,6 +34,22 @@ class Call:
     def scale(factor: float, number: float) -> float:
         return factor * number 
 
+    def __terms(self: Call) -> tuple:
+        """
+        returns sqrt(T), v * sqrt(T), drift * T, exp(-qT), exp(-rT)
+
+        These do not depend on the spot, so they are computed once and kept
+        until K, T, v, r or q is assigned. update_spot only pays for the
+        log term and the normal cdf/pdf.
+        """
+        if self._terms is None:
+            sqrt_T = np.sqrt(self.T)
+            drift_term = (self.r - self.q + self.v * self.v / 2) * self.T
+            terms = (sqrt_T, self.v * sqrt_T, drift_term, np.exp(-self.q * self.T), np.exp(-self.r * self.T))
+            object.__setattr__(self, '_terms', terms)
+
+        return self._terms
+
     def __ds(self: Call) -> tuple:
         """
         returns d1, d2 of Black and Scholes solution
@@ -32,16 +61,28 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        sigma_term = self.v * np.sqrt(self.T)
+        _, sigma_term, drift_term, _, _ = self.__terms()
         log_term   = np.log(self.S / self.K)
-        interest_term = self.r - self.q
-        drift_term = (interest_term + self.v * self.v / 2) 
         
-        d1 = (1 / sigma_term) * (log_term + drift_term * self.T)
+        d1 = (log_term + drift_term) / sigma_term
         d2 = d1 - sigma_term
     
         return d1, d2
 
+    def __normals(self: Call) -> tuple:
+        """
+        returns d1, d2, N(d1), N(d2), n(d1)
+
+        Computed once and shared by price and every greek until any
+        attribute is assigned. For puts the cdf terms are N(-d1), N(-d2).
+        """
+        if self._normals is None:
+            d1, d2 = self.__ds()
+            normals = (d1, d2, normal.cdf(self.SIGN * d1), normal.cdf(self.SIGN * d2), normal.pdf(d1))
+            object.__setattr__(self, '_normals', normals)
+
+        return self._normals
+
     def price(self: Call) -> float:
         """
         returns price of call option
@@ -53,8 +94,9 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, d2 = self.__ds() 
-        return norm.cdf(d1) * self.S * np.exp(-self.q * self.T) - norm.cdf(d2) * self.K * np.exp(-self.r * self.T)
+        _, _, cdf_d1, cdf_d2, _ = self.__normals()
+        _, _, _, q_discount, r_discount = self.__terms()
+        return cdf_d1 * self.S * q_discount - cdf_d2 * self.K * r_discount
 
     def delta(self: Call) -> float:
         """
@@ -67,8 +109,7 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, _ = self.__ds() 
-        return np.exp(-self.q * self.T) * norm.cdf(d1)
+        return self.__terms()[3] * self.__normals()[2]
  
     def gamma(self: Call) -> float:
         """
@@ -81,8 +122,8 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, _ = self.__ds()
-        return np.exp(-self.q * self.T) * norm.pdf(d1) / (self.S * self.v * np.sqrt(self.T))
+        _, sigma_term, _, q_discount, _ = self.__terms()
+        return q_discount * self.__normals()[4] / (self.S * sigma_term)
 
     def theta(self: Call) -> float:
         """
@@ -95,10 +136,11 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, d2 = self.__ds() 
-        first_term  = - self.S * np.exp(-self.q * self.T) * norm.pdf(d1) * self.v / (2 * np.sqrt(self.T))
-        second_term = - self.r * self.K * np.exp(-self.r * self.T) * norm.cdf(d2)
-        third_term = self.q * self.S * np.exp(-self.q * self.T) * norm.cdf(d1)
+        _, _, cdf_d1, cdf_d2, pdf_d1 = self.__normals()
+        sqrt_T, _, _, q_discount, r_discount = self.__terms()
+        first_term  = - self.S * q_discount * pdf_d1 * self.v / (2 * sqrt_T)
+        second_term = - self.r * self.K * r_discount * cdf_d2
+        third_term = self.q * self.S * q_discount * cdf_d1
 
         this_theta = first_term + second_term + third_term
 
@@ -116,8 +158,8 @@ class Call:
             r: float            interest rate
         """
 
-        d1, _ = self.__ds()
-        this_vega = self.S * np.exp(-self.q * self.T) * norm.pdf(d1) * np.sqrt(self.T)
+        sqrt_T, _, _, q_discount, _ = self.__terms()
+        this_vega = self.S * q_discount * self.__normals()[4] * sqrt_T
         return Call.scale(Call.VEGA_NORMALIZATION, this_vega)
 
     def rho(self: Call) -> float:
@@ -131,8 +173,25 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        _, d2 = self.__ds() 
-        return Call.scale(Call.RHO_NORMALIZATION, self.K * np.exp(-self.r * self.T) * norm.cdf(d2))
+        return Call.scale(Call.RHO_NORMALIZATION, self.K * self.__terms()[4] * self.__normals()[3])
+
+    def greek_values(self: Call) -> dict:
+        """
+        returns a dict with the delta, gamma, theta, vega and rho of option,
+        all computed from one evaluation of d1, d2 and the normal cdf/pdf
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return { 'delta' : self.delta(),           \
+                 'gamma' : self.gamma(),           \
+                 'theta' : self.theta(),           \
+                 'vega'  : self.vega(),            \
+                 'rho'   : self.rho()              }
 
     def greeks(self: Call) -> None:
         """
@@ -145,11 +204,7 @@ class Call:
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        option_data = { 'delta' : self.delta(),           \
-                        'gamma' : self.gamma(),           \
-                        'theta' : self.theta(),           \
-                        'vega'  : self.vega(),            \
-                        'rho'   : self.rho()              }
+        option_data = self.greek_values()
         
         for k, v in option_data.items():
             print("{:} = {:.2f}".format(k, v))
@@ -221,9 +276,182 @@ class Call:
         """
         return Notional * self.rho()
 
+    def vanna(self: Call) -> float:
+        """
+        returns vanna of option, the change of delta per vol point
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        _, d2, _, _, pdf_d1 = self.__normals()
+        q_discount = self.__terms()[3]
+        return Call.scale(Call.VEGA_NORMALIZATION, - q_discount * pdf_d1 * d2 / self.v)
+
+    def volga(self: Call) -> float:
+        """
+        returns volga (vomma) of option, the change of vega per vol point
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        d1, d2, _, _, _ = self.__normals()
+        return Call.scale(Call.VEGA_NORMALIZATION, self.vega() * d1 * d2 / self.v)
+
+    def charm(self: Call) -> float:
+        """
+        returns charm of option, the change of delta as time passes
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        _, d2, cdf_d1, _, pdf_d1 = self.__normals()
+        sqrt_T, sigma_term, _, q_discount, _ = self.__terms()
+        carry = 2 * (self.r - self.q) * self.T - d2 * sigma_term
+        this_charm = self.SIGN * self.q * q_discount * cdf_d1 \
+                     - q_discount * pdf_d1 * carry / (2 * self.T * sigma_term)
+        return Call.scale(Call.THETA_NORMALIZATION, this_charm)
+
+    def speed(self: Call) -> float:
+        """
+        returns speed of option, the change of gamma per unit of spot
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        d1 = self.__normals()[0]
+        sigma_term = self.__terms()[1]
+        return - Call.gamma(self) / self.S * (d1 / sigma_term + 1)
+
+    def zomma(self: Call) -> float:
+        """
+        returns zomma of option, the change of gamma per vol point
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        d1, d2, _, _, _ = self.__normals()
+        return Call.scale(Call.VEGA_NORMALIZATION, Call.gamma(self) * (d1 * d2 - 1) / self.v)
+
+    def color(self: Call) -> float:
+        """
+        returns color of option, the change of gamma as time passes
+    
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        d1, d2, _, _, pdf_d1 = self.__normals()
+        _, sigma_term, _, q_discount, _ = self.__terms()
+        carry = 2 * (self.r - self.q) * self.T - d2 * sigma_term
+        first_term  = q_discount * pdf_d1 / (2 * self.S * self.T * sigma_term)
+        second_term = 2 * self.q * self.T + 1 + carry / sigma_term * d1
+        return Call.scale(Call.THETA_NORMALIZATION, first_term * second_term)
+
+    def dollar_vanna(self: Call, Notional: float) -> float:
+        """
+        returns dollar vanna for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.vanna()
+
+    def dollar_volga(self: Call, Notional: float) -> float:
+        """
+        returns dollar volga for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.volga()
+
+    def dollar_charm(self: Call, Notional: float) -> float:
+        """
+        returns dollar charm for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.charm()
+
+    def dollar_speed(self: Call, Notional: float) -> float:
+        """
+        returns dollar speed for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.speed() * self.S / 100 * self.S / 100
+
+    def dollar_zomma(self: Call, Notional: float) -> float:
+        """
+        returns dollar zomma for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.zomma() * self.S / 100
+
+    def dollar_color(self: Call, Notional: float) -> float:
+        """
+        returns dollar color for a given Notional 
+
+        receives Option object with the following attributes:
+            S: float            spot price,
+            K: float            option strike,
+            T: float            delta time until expire,
+            v: float            volatility (implied or realized),
+            r: float            interest rate
+        """
+        return Notional * self.color() * self.S / 100
+
 class Put(Call): 
+    SIGN = -1
 
-    __slots__ = ('S', 'K', 'T', 'v', 'r', 'q')
+    __slots__ = ()
     def __init__(self: Put, **kwargs):
         Call.__init__(self, **kwargs)
 
@@ -238,8 +466,9 @@ class Put(Call):
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, d2 = self._Call__ds() 
-        return norm.cdf(-d2) * self.K * np.exp(- self.r * self.T) - norm.cdf(-d1) * self.S * np.exp(-self.q * self.T)
+        _, _, cdf_d1, cdf_d2, _ = self._Call__normals()
+        _, _, _, q_discount, r_discount = self._Call__terms()
+        return cdf_d2 * self.K * r_discount - cdf_d1 * self.S * q_discount
 
     def delta(self: Put) -> float:
         """
@@ -252,7 +481,7 @@ class Put(Call):
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        return np.exp(self.q * self.T) * (Call.delta(self) - 1)
+        return - self._Call__terms()[3] * self._Call__normals()[2]
 
     def theta(self: Put) -> float:
         """
@@ -265,10 +494,11 @@ class Put(Call):
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        d1, d2 = self._Call__ds() 
-        first_term  = - np.exp(self.q * self.T) * self.S * norm.pdf(d1) * self.v / (2 * np.sqrt(self.T))
-        second_term = + self.r * self.K * np.exp(-self.r * self.T) * norm.cdf(-d2)
-        third_term = - self.q * self.S * np.exp(-self.q * self.T) * norm.cdf(-d1)
+        _, _, cdf_d1, cdf_d2, pdf_d1 = self._Call__normals()
+        sqrt_T, _, _, q_discount, r_discount = self._Call__terms()
+        first_term  = - q_discount * self.S * pdf_d1 * self.v / (2 * sqrt_T)
+        second_term = + self.r * self.K * r_discount * cdf_d2
+        third_term = - self.q * self.S * q_discount * cdf_d1
 
         this_theta = first_term + second_term + third_term
 
@@ -311,7 +541,194 @@ class Put(Call):
             v: float            volatility (implied or realized),
             r: float            interest rate
         """
-        _, d2 = self._Call__ds() 
-        return Call.scale(Call.RHO_NORMALIZATION, - self.K * np.exp(-self.r * self.T) * norm.cdf(-d2))
+        return Call.scale(Call.RHO_NORMALIZATION, - self.K * self._Call__terms()[4] * self._Call__normals()[3])
+
+
+
+class OptionArray:
+    """
+    Column store of options priced together through black_scholes.greeks.
+
+    S, K, T, v, r, q are float64 arrays and is_call a mask, so one object
+    holds a mixed book. Methods follow the Call/Put conventions (theta per
+    1/252, vega and rho per 1/100) and return arrays. book[i] is a Call or
+    Put view reading and writing row i of the same buffers, book[a:b] and
+    boolean masks give OptionArrays.
+    """
+    FIELDS = ('S', 'K', 'T', 'v', 'r', 'q')
+
+    __slots__ = ('S', 'K', 'T', 'v', 'r', 'q', 'is_call')
+    def __init__(self, is_call = True, **kwargs):
+        for key in OptionArray.FIELDS:
+            setattr(self, key, np.asarray(kwargs[key], dtype = np.float64))
+        self.is_call = np.broadcast_to(np.asarray(is_call, dtype = bool), self.K.shape)
+
+    @staticmethod
+    def from_book(book) -> OptionArray:
+        """
+        wraps the columns of a black_scholes.option / OptionBook, no copies
+        """
+        return OptionArray(getattr(book, 'is_call', True), **{k: getattr(book, k) for k in OptionArray.FIELDS})
+
+    def __len__(self: OptionArray) -> int:
+        return len(self.K)
+
+    def __getitem__(self: OptionArray, index):
+        if isinstance(index, (int, np.integer)):
+            index = range(len(self))[index]
+            view = CallView if self.is_call[index] else PutView
+            return view(self, index)
+
+        columns = {k: getattr(self, k)[index] for k in OptionArray.FIELDS}
+        return OptionArray(self.is_call[index], **columns)
+
+    def __iter__(self: OptionArray):
+        return (self[i] for i in range(len(self)))
+
+    def __evaluate(self: OptionArray, which: tuple) -> dict:
+        import black_scholes
+
+        o = black_scholes.option(self.S, self.K, self.T, self.v, self.r, self.q)
+        values = black_scholes.greeks(o, which, is_call = self.is_call)
+        # black_scholes scales time derivatives by 1/100, Call by THETA_NORMALIZATION
+        for name in ('theta', 'charm', 'color'):
+            if name in values:
+                values[name] = Call.scale(100 * Call.THETA_NORMALIZATION, values[name])
+        return values
+
+    def price(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('price',))['price']
+
+    def delta(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('delta',))['delta']
+
+    def gamma(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('gamma',))['gamma']
+
+    def theta(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('theta',))['theta']
+
+    def vega(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('vega',))['vega']
+
+    def rho(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('rho',))['rho']
+
+    def vanna(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('vanna',))['vanna']
+
+    def volga(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('volga',))['volga']
+
+    def charm(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('charm',))['charm']
+
+    def speed(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('speed',))['speed']
+
+    def zomma(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('zomma',))['zomma']
+
+    def color(self: OptionArray) -> np.ndarray:
+        return self.__evaluate(('color',))['color']
+
+    def higher_order_values(self: OptionArray) -> dict:
+        """
+        returns vanna, volga, charm, speed, zomma and color arrays from a single pass
+        """
+        return self.__evaluate(('vanna', 'volga', 'charm', 'speed', 'zomma', 'color'))
+
+    def greek_values(self: OptionArray) -> dict:
+        """
+        returns delta, gamma, theta, vega and rho arrays from a single pass
+        """
+        return self.__evaluate(('delta', 'gamma', 'theta', 'vega', 'rho'))
+
+    def dollar_delta(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.delta()
+
+    def dollar_gamma(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.gamma() * self.S / 100
+
+    def dollar_theta(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.theta()
+
+    def dollar_vega(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.vega()
+
+    def dollar_rho(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.rho()
+
+    def dollar_vanna(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.vanna()
+
+    def dollar_volga(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.volga()
+
+    def dollar_charm(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.charm()
+
+    def dollar_speed(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.speed() * self.S / 100 * self.S / 100
+
+    def dollar_zomma(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.zomma() * self.S / 100
+
+    def dollar_color(self: OptionArray, Notional: np.ndarray) -> np.ndarray:
+        return Notional * self.color() * self.S / 100
+
+class CallArray(OptionArray):
+    __slots__ = ()
+    def __init__(self: CallArray, **kwargs):
+        OptionArray.__init__(self, True, **kwargs)
+
+class PutArray(OptionArray):
+    __slots__ = ()
+    def __init__(self: PutArray, **kwargs):
+        OptionArray.__init__(self, False, **kwargs)
+
+def view_field(name: str) -> property:
+    def getter(self):
+        return getattr(self._array, name)[self._index]
+
+    def setter(self, value):
+        getattr(self._array, name)[self._index] = value
+
+    return property(getter, setter)
+
+class ArrayView:
+    """
+    Row of an OptionArray behaving as a Call/Put. Attribute reads and
+    writes go to the array buffers, which may also change in place behind
+    the view, so nothing is memoized: every greek is recomputed from the
+    current values.
+    """
+    __slots__ = ()
+
+    S = view_field('S')
+    K = view_field('K')
+    T = view_field('T')
+    v = view_field('v')
+    r = view_field('r')
+    q = view_field('q')
+
+    def __init__(self, array: OptionArray, index: int):
+        object.__setattr__(self, '_array', array)
+        object.__setattr__(self, '_index', index)
+        object.__setattr__(self, '_terms', None)
+        object.__setattr__(self, '_normals', None)
+
+    # the name mangled helpers of Call, with their caches dropped first
+    def _Call__terms(self) -> tuple:
+        object.__setattr__(self, '_terms', None)
+        return Call._Call__terms(self)
+
+    def _Call__normals(self) -> tuple:
+        object.__setattr__(self, '_normals', None)
+        return Call._Call__normals(self)
 
+class CallView(ArrayView, Call):
+    __slots__ = ('_array', '_index')
 
+class PutView(ArrayView, Put):
+    __slots__ = ('_array', '_index')
@@ -0,0 +1,161 @@
+import os
+import time
+from multiprocessing import get_context, get_all_start_methods, shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+from utils.data_handling import generate_spot_interval
+
+# rows of the shared input block
+INPUT_FIELDS = ("S", "K", "T", "v", "r", "q", "notional", "is_call")
+
+# segment attached by this worker process for each role, kept open
+# between tasks and closed once the parent has grown it into a new one
+attached = dict()
+
+def attach(role: str, name: str, shape: tuple) -> np.ndarray:
+    current = attached.get(role)
+    if current is None or current.name != name:
+        if current is not None:
+            current.close()
+        current = attached[role] = shared_memory.SharedMemory(name = name)
+    return np.ndarray(shape, dtype = np.float64, buffer = current.buf)
+
+def process_context(preload: list = ()):
+    """
+    multiprocessing context for worker pools. A fork taken once numba has
+    started its thread pool hangs when the workers exit, so workers start
+    from a clean forkserver where there is one. Modules in `preload` are
+    imported once by the server rather than by every worker.
+    """
+    if "forkserver" not in get_all_start_methods():
+        return get_context(None)
+    context = get_context("forkserver")
+    if preload:
+        context.set_forkserver_preload(list(preload))
+    return context
+
+def price_slice(task: tuple) -> tuple:
+    """
+    Worker side: attaches to the shared inputs and output, prices one
+    option or scenario slice in place and returns its timings.
+    """
+    (input_name, input_shape, output_name, output_shape, 
+     percentuals_name, n_scenarios, which, outputs, axis, start, stop) = task
+
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    inputs = attach("input", input_name, input_shape)
+    out = attach("output", output_name, output_shape)
+    percentuals = attach("percentuals", percentuals_name, (n_scenarios,))
+
+    options = slice(None)
+    scenarios = slice(None)
+    if axis == "option":
+        options = slice(start, stop)
+    else:
+        scenarios = slice(start, stop)
+
+    S, K, T, v, r, q, notional, is_call = inputs[:, options]
+    o = option(generate_spot_interval(S, percentuals[scenarios]), K, T, v, r, q)
+    greeks = black_scholes.greeks(o, which, notional, is_call.astype(bool))
+
+    for position, name in enumerate(outputs):
+        out[position, scenarios, options] = greeks[name]
+
+    return os.getpid(), stop - start, time.perf_counter() - wall, time.process_time() - cpu
+
+class SharedMemoryPricer:
+    """
+    Process pool that prices a book over a spot ladder in parallel.
+
+    The option columns, the ladder and the (greeks, scenarios, options)
+    output live in multiprocessing.shared_memory, so tasks only carry
+    segment names and slice bounds. The pool and the segments are kept
+    and reused across calls until close().
+    """
+    def __init__(self, workers: int = None, tasks_per_worker: int = 4):
+        self.workers = workers or os.cpu_count()
+        self.tasks_per_worker = tasks_per_worker
+        self.pool = ProcessPoolExecutor(max_workers = self.workers, mp_context = process_context())
+        self.segments = dict()
+        self.timings = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def segment(self, role: str, shape: tuple) -> tuple:
+        """
+        Returns (name, array) for a segment of at least `shape`, growing
+        the one held for `role` only when it is too small.
+        """
+        size = max(8, 8 * int(np.prod(shape)))
+        current = self.segments.get(role)
+        if current is None or current.size < size:
+            if current is not None:
+                current.close()
+                current.unlink()
+            current = shared_memory.SharedMemory(create = True, size = size)
+            self.segments[role] = current
+        return current.name, np.ndarray(shape, dtype = np.float64, buffer = current.buf)
+
+    def price(self, 
+              o: option, 
+              percentuals: np.ndarray, 
+              which: tuple = ("delta", "gamma"), 
+              notional: np.ndarray = None, 
+              is_call = True, 
+              axis: str = "option") -> dict:
+        """
+        Same results as black_scholes.greeks on generate_spot_interval(o.S,
+        percentuals), bit for bit. `axis` chooses whether workers split
+        the options or the scenarios. Per-worker timings of the call are
+        left in `self.timings`.
+        """
+        if axis not in ("option", "scenario"):
+            raise ValueError("axis must be 'option' or 'scenario'")
+
+        columns = np.broadcast_arrays(o.S, o.K, o.T, o.v, o.r, o.q, 
+                                      notional if notional is not None else 0.0, is_call)
+        n_options = columns[0].shape[-1]
+        n_scenarios = len(percentuals)
+        outputs = list(which) + (["dollar_" + x for x in which] if notional is not None else [])
+
+        input_shape = (len(INPUT_FIELDS), n_options)
+        output_shape = (len(outputs), n_scenarios, n_options)
+        input_name, inputs = self.segment("input", input_shape)
+        output_name, out = self.segment("output", output_shape)
+        percentuals_name, shared_percentuals = self.segment("percentuals", (n_scenarios,))
+
+        for row, column in zip(inputs, columns):
+            row[:] = column
+        shared_percentuals[:] = percentuals
+
+        length = n_options if axis == "option" else n_scenarios
+        step = max(1, -(-length // (self.workers * self.tasks_per_worker)))
+        tasks = [(input_name, input_shape, output_name, output_shape, percentuals_name, n_scenarios, 
+                  tuple(which), outputs, axis, start, min(start + step, length)) 
+                 for start in range(0, length, step)]
+
+        self.timings = dict()
+        for pid, items, wall, cpu in self.pool.map(price_slice, tasks):
+            stats = self.timings.setdefault(pid, {"tasks": 0, "items": 0, "wall": 0.0, "cpu": 0.0})
+            stats["tasks"] += 1
+            stats["items"] += items
+            stats["wall"] += wall
+            stats["cpu"] += cpu
+
+        return {name: out[position].copy() for position, name in enumerate(outputs)}
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        for segment in self.segments.values():
+            segment.close()
+            segment.unlink()
+        self.segments = dict()
@@ -0,0 +1,178 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import black_scholes
+from utils.book import OptionBook, book_from_columns
+from utils.aggregate import reduce_by_code
+from utils.data_handling import check_columns, generate_spot_interval, must_have_columns, scenario_column_names, \
+                                 read_data_from_numpy, import_pyarrow, arrow_table_to_dataframe
+
+DEFAULT_CHUNK_ROWS = 50_000
+
+def read_excel_chunks(xlsx_file: str, chunk_rows: int):
+    """
+    Streams the first sheet with openpyxl's read-only mode, which keeps
+    one row in memory at a time instead of the whole workbook.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_file, read_only = True, data_only = True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only = True)
+        header = next(rows)
+
+        buffer = []
+        for row in rows:
+            if all(x is None for x in row):
+                continue
+            buffer.append(row)
+            if len(buffer) == chunk_rows:
+                yield check_columns(pd.DataFrame(buffer, columns = header))
+                buffer = []
+
+        if buffer:
+            yield check_columns(pd.DataFrame(buffer, columns = header))
+    finally:
+        workbook.close()
+
+def read_csv_chunks(csv_file: str, chunk_rows: int):
+    for chunk in pd.read_csv(csv_file, chunksize = chunk_rows):
+        yield check_columns(chunk)
+
+def read_pickle_chunks(pickle_file: str, chunk_rows: int):
+    # pickles cannot be read partially, only the pricing is chunked
+    data = check_columns(pd.read_pickle(pickle_file))
+    for start in range(0, len(data), chunk_rows):
+        yield data.iloc[start:start + chunk_rows]
+
+def read_parquet_chunks(parquet_file: str, chunk_rows: int):
+    import_pyarrow()
+    import pyarrow
+    import pyarrow.parquet
+
+    parquet = pyarrow.parquet.ParquetFile(parquet_file, memory_map = True)
+    check_columns(parquet.schema_arrow.names)
+    for batch in parquet.iter_batches(batch_size = chunk_rows, columns = sorted(must_have_columns)):
+        yield arrow_table_to_dataframe(pyarrow.Table.from_batches([batch]))
+
+def read_npz_member(archive: zipfile.ZipFile, name: str, chunk_rows: int):
+    """
+    Yields one column of an .npz archive in chunks of rows. The member is
+    decompressed as a stream, so every byte is read once and only one
+    chunk of the column is held at a time.
+    """
+    with archive.open(name + ".npy") as member:
+        version = np.lib.format.read_magic(member)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                      else np.lib.format.read_array_header_2_0
+        shape, _, dtype = read_header(member)
+        if dtype.hasobject:
+            raise ValueError("cannot stream the object column {:} of {:}".format(name, archive.filename))
+
+        for start in range(0, shape[0], chunk_rows):
+            count = min(chunk_rows, shape[0] - start)
+            yield np.frombuffer(member.read(count * dtype.itemsize), dtype = dtype)
+
+def read_numpy_chunks(numpy_file: str, chunk_rows: int):
+    if numpy_file.endswith(".npy"):
+        # slices of the memory-mapped .npy are views, pages are read on access
+        data = read_data_from_numpy(numpy_file)
+        for start in range(0, len(data), chunk_rows):
+            yield data[start:start + chunk_rows]
+        return
+
+    names = sorted(must_have_columns)
+    with zipfile.ZipFile(numpy_file) as archive:
+        check_columns([x[:-len(".npy")] for x in archive.namelist()])
+        columns = [read_npz_member(archive, name, chunk_rows) for name in names]
+        try:
+            for chunk in zip(*columns):
+                yield dict(zip(names, chunk))
+        finally:
+            for column in columns:
+                column.close()
+
+CHUNK_READERS = { "xlsx"    : read_excel_chunks     \
+                , "csv"     : read_csv_chunks       \
+                , "pickle"  : read_pickle_chunks    \
+                , "parquet" : read_parquet_chunks   \
+                , "npy"     : read_numpy_chunks     \
+                , "npz"     : read_numpy_chunks     }
+
+def read_chunks(file: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    for extension, reader in CHUNK_READERS.items():
+        if file.endswith(extension):
+            return reader(file, chunk_rows)
+
+    raise ValueError("cannot stream {:}, expected one of {:}".format(file, list(CHUNK_READERS)))
+
+def price_chunks(chunks, percentuals: np.ndarray, which: tuple = ("delta", "gamma")):
+    """
+    Yields (book, greeks) per input chunk, with greeks of shape
+    (scenarios, chunk options). Nothing is kept between chunks.
+    """
+    for data in chunks:
+        book = book_from_columns(data)
+        book.S = generate_spot_interval(book.S, percentuals)
+        yield book, black_scholes.greeks(book, which, book.notional, book.is_call)
+
+class OnlineAggregate:
+    """
+    Running sums of the dollar greeks per scenario, for the whole book
+    and per underlying (`ativo`), updated one chunk at a time.
+    """
+    def __init__(self, which: tuple, n_scenarios: int):
+        self.which = which
+        self.n_scenarios = n_scenarios
+        self.count = 0
+        self.totals = {name: np.zeros(n_scenarios) for name in which}
+        self.by_underlying = dict()
+
+    def update(self, book: OptionBook, greeks: dict) -> None:
+        self.count += len(book)
+        for name in self.which:
+            dollar = greeks["dollar_" + name]
+            self.totals[name] += dollar.sum(axis = -1)
+
+            sums = reduce_by_code(dollar, book.codes, len(book.names))
+            for underlying, row in zip(book.names, sums.T):
+                per_greek = self.by_underlying.setdefault(str(underlying), 
+                    {x: np.zeros(self.n_scenarios) for x in self.which})
+                per_greek[name] += row
+
+class WriterSink:
+    """
+    Writes the per-option dollar greeks of each chunk through a
+    utils.writers.TableWriter, one sheet per greek laid out like the
+    greeks.xlsx tables.
+    """
+    def __init__(self, writer, which: tuple, percentuals: np.ndarray):
+        self.writer = writer
+        self.which = which
+        for name in which:
+            writer.add_sheet(name.capitalize(), scenario_column_names(name.capitalize(), percentuals))
+
+    def __call__(self, book: OptionBook, greeks: dict) -> None:
+        for name in self.which:
+            self.writer.write(name.capitalize(), book.labels, greeks["dollar_" + name].T)
+
+def run_pipeline(file: str, 
+                 percentuals: np.ndarray, 
+                 sink = None, 
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, 
+                 which: tuple = ("delta", "gamma")) -> OnlineAggregate:
+    """
+    Reads `file` in chunks of `chunk_rows`, prices each chunk over the
+    spot ladder and hands it to `sink(book, greeks)` before reading the
+    next one. Peak memory follows the chunk size, not the book size.
+    """
+    aggregate = OnlineAggregate(which, len(percentuals))
+
+    for book, greeks in price_chunks(read_chunks(file, chunk_rows), percentuals, which):
+        aggregate.update(book, greeks)
+        if sink is not None:
+            sink(book, greeks)
+
+    return aggregate
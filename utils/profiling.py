@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import functools
+import threading
+import contextlib
+import dataclasses
+import tracemalloc
+
+import numpy as np
+
+PROFILE_ENVIRONMENT_VARIABLE = "BLACK_SCHOLES_PROFILE"
+
+# names in black_scholes wrapped by instrument_kernels
+KERNELS = ["greeks", "greeks_at_spot", "greeks_into", "spot_independent_terms"] \
+        + ["{:}_{:}{:}".format(leg, dollar, name) for dollar in ("", "dollar_")
+                                                   for leg in ("call", "put")
+                                                   for name in ("price", "delta", "gamma", "theta", "vega", "rho",
+                                                                "vanna", "volga", "charm", "speed", "zomma", "color")]
+
+ENABLED = False
+OUTPUT_FILE = None
+SPANS = []
+STACK = []
+ORIGIN = time.perf_counter()
+NULL_STAGE = contextlib.nullcontext()
+
+@dataclasses.dataclass
+class Span:
+    name: str
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_traced: int = 0
+    peak_rss: int = 0
+    arrays: int = 0
+    elements: int = 0
+    nbytes: int = 0
+    depth: int = 0
+
+def array_sizes(values) -> tuple:
+    """
+    (count, elements, bytes) of the numpy arrays in values, looking inside
+    dicts, lists and dataclasses such as black_scholes.option.
+    """
+    seen, stack = set(), list(values)
+    count = elements = nbytes = 0
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, np.ndarray):
+            count, elements, nbytes = count + 1, elements + value.size, nbytes + value.nbytes
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+            stack.extend(getattr(value, x.name) for x in dataclasses.fields(value))
+    return count, elements, nbytes
+
+def peak_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+@contextlib.contextmanager
+def span(name: str, *values):
+    record = Span(name, time.perf_counter(), depth = len(STACK))
+    record.arrays, record.elements, record.nbytes = array_sizes(values)
+    STACK.append(record)
+    tracemalloc.reset_peak()
+    cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall = time.perf_counter() - record.start
+        record.cpu = time.process_time() - cpu
+        record.peak_traced = max(record.peak_traced, tracemalloc.get_traced_memory()[1])
+        record.peak_rss = peak_rss()
+        STACK.pop()
+        # reset_peak above wiped the parent's peak, hand ours back to it
+        if STACK:
+            STACK[-1].peak_traced = max(STACK[-1].peak_traced, record.peak_traced)
+        tracemalloc.reset_peak()
+        SPANS.append(record)
+
+def stage(name: str, *values):
+    """
+    Times a stage of main.main(). Returns a shared no-op context manager
+    unless profiling was enabled.
+    """
+    if not ENABLED or threading.current_thread() is not threading.main_thread():
+        return NULL_STAGE
+    return span(name, *values)
+
+def profiled(function, name: str):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if threading.current_thread() is not threading.main_thread():
+            return function(*args, **kwargs)
+        with span(name, args, kwargs) as record:
+            result = function(*args, **kwargs)
+            _, elements, nbytes = array_sizes([result])
+            record.elements, record.nbytes = record.elements + elements, record.nbytes + nbytes
+        return result
+    wrapper.profiled = True
+    return wrapper
+
+def instrument_kernels() -> None:
+    """
+    Replaces the pricing kernels of black_scholes by timed wrappers. Calls
+    between kernels go through the module globals, so they are timed too.
+    """
+    import black_scholes
+
+    for name in KERNELS:
+        function = getattr(black_scholes, name, None)
+        if function is not None and not getattr(function, "profiled", False):
+            setattr(black_scholes, name, profiled(function, "black_scholes." + name))
+
+def enable(output_file: str) -> None:
+    """
+    Starts recording stages and kernel calls. The trace is written to
+    output_file and the summary printed when the interpreter exits.
+    """
+    global ENABLED, OUTPUT_FILE
+    if ENABLED:
+        return
+
+    ENABLED, OUTPUT_FILE = True, output_file
+    tracemalloc.start()
+    instrument_kernels()
+    atexit.register(report)
+
+def enable_from_environment() -> None:
+    output_file = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE)
+    if output_file:
+        enable(output_file)
+
+def chrome_trace() -> dict:
+    """
+    Spans in the Chrome trace event format, for chrome://tracing or Perfetto.
+    """
+    events = []
+    for record in SPANS:
+        events.append({ "name" : record.name                                \
+                      , "ph"   : "X"                                        \
+                      , "ts"   : 1e6 * (record.start - ORIGIN)              \
+                      , "dur"  : 1e6 * record.wall                          \
+                      , "pid"  : os.getpid()                                \
+                      , "tid"  : 0                                          \
+                      , "args" : { "cpu_s"            : record.cpu          \
+                                 , "peak_traced_bytes": record.peak_traced  \
+                                 , "peak_rss_bytes"   : record.peak_rss     \
+                                 , "arrays"           : record.arrays       \
+                                 , "elements"         : record.elements     \
+                                 , "nbytes"           : record.nbytes       }})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def summary() -> str:
+    totals = dict()
+    for record in sorted(SPANS, key = lambda x: x.start):
+        calls, wall, cpu, traced, rss, elements, depth = totals.get(record.name, (0, 0.0, 0.0, 0, 0, 0, record.depth))
+        totals[record.name] = (calls + 1, wall + record.wall, cpu + record.cpu, max(traced, record.peak_traced),
+                               max(rss, record.peak_rss), elements + record.elements, min(depth, record.depth))
+
+    lines = ["{:<40} {:>7} {:>10} {:>10} {:>12} {:>12} {:>14}".format(
+             "stage", "calls", "wall s", "cpu s", "traced MiB", "rss MiB", "elements")]
+    for name, (calls, wall, cpu, traced, rss, elements, depth) in totals.items():
+        lines.append("{:<40} {:>7} {:>10.4f} {:>10.4f} {:>12.1f} {:>12.1f} {:>14,}".format(
+                     "  " * depth + name, calls, wall, cpu, traced / 2**20, rss / 2**20, elements))
+    return "\n".join(lines)
+
+def report() -> None:
+    with open(OUTPUT_FILE, "w") as handle:
+        json.dump(chrome_trace(), handle)
+    print(summary(), file = sys.stderr)
+    print("trace written to {:}".format(OUTPUT_FILE), file = sys.stderr)
@@ -0,0 +1,190 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+from utils.book import OptionBook
+from utils.aggregate import reduce_by_code
+from utils.scenarios import DEFAULT_MEMORY_BUDGET, MIN_TIME, MIN_VOL, WORKING_ARRAYS, chunk_slices
+
+# Taylor terms in the shocks x (relative spot move), dv (absolute vol
+# shift) and days (calendar days elapsed), the same conventions as
+# utils.scenarios.SHOCKS
+TERMS = ("x", "x2", "dv", "dv2", "x_dv", "days", "x_days")
+AXES = ("spot", "vol", "time")
+
+def shock_arrays(scenarios: dict) -> tuple:
+    """
+    (x, dv, days) broadcast together. Shocks of shape (scenarios,) apply
+    to every underlying; as soon as one of them is given per underlying,
+    shape (scenarios, underlyings), all three are returned in that shape.
+    """
+    unknown = set(scenarios) - set(AXES)
+    if unknown:
+        raise ValueError("unknown shock axes: {:}, expected {:}".format(sorted(unknown), list(AXES)))
+
+    shocks = [np.asarray(scenarios.get(name, 0.0), dtype = np.float64) for name in AXES]
+    if max(x.ndim for x in shocks) == 2:
+        shocks = [x.reshape(-1, 1) if x.ndim == 1 else x for x in shocks]
+    shape = np.broadcast_shapes(*(x.shape for x in shocks))
+    return tuple(np.broadcast_to(x, shape) for x in shocks)
+
+@dataclass
+class TaylorProxy:
+    """
+    Second order expansion of the book value around today's market.
+
+    `coefficients` has shape (terms, options) in P&L units (notional times
+    price) per unit of each monomial in TERMS; `by_underlying` sums them
+    per underlying, shape (terms, underlyings) with columns in `names`
+    order. Evaluating a scenario on the aggregates costs a few
+    multiply-adds per underlying, whatever the size of the book.
+    """
+    names: np.ndarray
+    codes: np.ndarray
+    coefficients: np.ndarray
+    by_underlying: np.ndarray
+
+    def monomials(self, scenarios: dict, columns: np.ndarray = None) -> np.ndarray:
+        """
+        (scenarios, [underlyings,] terms) values of the TERMS monomials.
+        Each shock is either one value per scenario, shape (scenarios,),
+        or one per underlying, shape (scenarios, underlyings); `columns`
+        picks underlyings out of the latter (the book codes for option
+        level P&L).
+        """
+        x, dv, days = shock_arrays(scenarios)
+        if columns is not None and x.ndim == 2:
+            x, dv, days = x[:, columns], dv[:, columns], days[:, columns]
+
+        return np.stack((x, x * x, dv, dv * dv, x * dv, days, x * days), axis = -1)
+
+    def pnl(self, scenarios: dict, by: str = "book") -> np.ndarray:
+        """
+        Approximate P&L per scenario, by "book" (scenarios,), by
+        "underlying" (scenarios, underlyings) or by "option"
+        (scenarios, options). Only the option level builds a per-option
+        matrix.
+        """
+        if by == "option":
+            terms = self.monomials(scenarios, self.codes)
+            if terms.ndim == 2:
+                return terms @ self.coefficients
+            return np.einsum("sot,to->so", terms, self.coefficients)
+
+        terms = self.monomials(scenarios)
+        if terms.ndim == 2:
+            per_underlying = terms @ self.by_underlying
+        else:
+            per_underlying = np.einsum("sut,tu->su", terms, self.by_underlying)
+
+        if by == "underlying":
+            return per_underlying
+        if by == "book":
+            return per_underlying.sum(axis = 1)
+        raise ValueError("unknown aggregation: {:}, expected book, underlying or option".format(by))
+
+def taylor_proxy(book: OptionBook, backend: str = None) -> TaylorProxy:
+    """
+    Expands the book around its current spots with one greeks() call:
+    delta and gamma in spot, vega and volga in vol, theta in time, and the
+    vanna and charm cross terms.
+    """
+    which = ("delta", "gamma", "theta", "vega", "vanna", "volga", "charm")
+    g = black_scholes.greeks(book, which, is_call = book.is_call, backend = backend)
+    N, S = book.notional, book.S
+
+    # black_scholes scales vol derivatives per vol point and time
+    # derivatives by 1/100 per year, undo both into per unit shock
+    coefficients = np.stack(( N * g["delta"] * S                                \
+                            , N * g["gamma"] * S * S / 2                        \
+                            , N * g["vega"] * 100                               \
+                            , N * g["volga"] * 10000 / 2                        \
+                            , N * g["vanna"] * 100 * S                          \
+                            , N * g["theta"] * 100 / 365                        \
+                            , N * g["charm"] * 100 / 365 * S                    ))
+
+    by_underlying = reduce_by_code(coefficients, book.codes, len(book.names))
+    return TaylorProxy(book.names, book.codes, coefficients, by_underlying)
+
+def shocked_book(book: OptionBook, x, dv, days) -> option:
+    return option( book.S * (1 + x)                                     \
+                 , book.K                                               \
+                 , np.maximum(book.T - days / 365, MIN_TIME)            \
+                 , np.maximum(book.v + dv, MIN_VOL)                     \
+                 , book.r                                               \
+                 , book.q                                               )
+
+def full_revaluation(book: OptionBook,
+                     scenarios: dict,
+                     memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                     backend: str = None) -> np.ndarray:
+    """
+    Exact P&L per scenario and underlying, shape (scenarios, underlyings),
+    repricing the whole book under every scenario in blocks of scenarios.
+    """
+    n_options, n_groups = len(book), len(book.names)
+    base = black_scholes.greeks(book, ("price",), book.notional, book.is_call, backend)["dollar_price"]
+
+    shocks = shock_arrays(scenarios)
+    if shocks[0].ndim == 2:
+        shocks = [values[:, book.codes] for values in shocks]
+    else:
+        shocks = [values[:, np.newaxis] for values in shocks]
+
+    n_scenarios = len(shocks[0])
+    result = np.zeros((n_scenarios, n_groups))
+    rows_per_chunk = max(1, memory_budget // (8 * WORKING_ARRAYS * max(1, n_options)))
+    for rows in chunk_slices(n_scenarios, rows_per_chunk):
+        x, dv, days = (values[rows] for values in shocks)
+        value = black_scholes.greeks(shocked_book(book, x, dv, days), ("price",), book.notional, book.is_call,
+                                     backend)["dollar_price"]
+        reduce_by_code(value - base, book.codes, n_groups, result[rows])
+
+    return result
+
+@dataclass
+class ProxyError:
+    """
+    Proxy against full revaluation on `sample` scenarios. The absolute
+    errors are in P&L units; the relative error divides the largest
+    absolute error by the largest absolute exact P&L of the sample.
+    """
+    sample: np.ndarray
+    exact: np.ndarray
+    approximate: np.ndarray
+    max_abs: float
+    rms: float
+    max_rel: float
+    max_abs_by_underlying: np.ndarray
+
+def proxy_error(proxy: TaylorProxy,
+                book: OptionBook,
+                scenarios: dict,
+                sample_size: int = 256,
+                seed: int = 0,
+                backend: str = None) -> ProxyError:
+    """
+    Bounds the proxy error by fully revaluing a random sample of the
+    scenarios. The bound is empirical: scenarios further out than the
+    sample can do worse.
+    """
+    shocks = shock_arrays(scenarios)
+    n_scenarios = len(shocks[0])
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n_scenarios, min(sample_size, n_scenarios), replace = False))
+
+    sampled = {name: values[sample] for name, values in zip(AXES, shocks)}
+    exact = full_revaluation(book, sampled, backend = backend)
+    approximate = proxy.pnl(sampled, by = "underlying")
+
+    error = np.abs(approximate.sum(axis = 1) - exact.sum(axis = 1))
+    scale = np.abs(exact.sum(axis = 1)).max()
+    return ProxyError( sample                                                   \
+                     , exact                                                    \
+                     , approximate                                              \
+                     , float(error.max())                                       \
+                     , float(np.sqrt(np.mean(error * error)))                   \
+                     , float(error.max() / scale) if scale > 0 else 0.0         \
+                     , np.abs(approximate - exact).max(axis = 0)                )
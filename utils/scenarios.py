@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import black_scholes
+from black_scholes import option
+
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+
+# Working arrays alive at once per grid cell in a greeks() call, on top of
+# the requested outputs (d1, d2, discounts, cdfs, pdf, shocked inputs).
+WORKING_ARRAYS = 12
+
+# shocked options are never priced past their expiry: one hour is left
+MIN_TIME = 1 / (365 * 24)
+
+# and never with a vol shocked to zero or below: a hundredth of a vol point
+MIN_VOL = 1e-4
+
+def shock_spot(o: option, x: np.ndarray) -> option:
+    return option(o.S * (1 + x), o.K, o.T, o.v, o.r, o.q)
+
+def shock_vol(o: option, x: np.ndarray) -> option:
+    return option(o.S, o.K, o.T, np.maximum(o.v + x, MIN_VOL), o.r, o.q)
+
+def shock_time(o: option, x: np.ndarray) -> option:
+    return option(o.S, o.K, np.maximum(o.T - x / 365, MIN_TIME), o.v, o.r, o.q)
+
+def shock_rate(o: option, x: np.ndarray) -> option:
+    return option(o.S, o.K, o.T, o.v, o.r + x, o.q)
+
+def shock_dividend(o: option, x: np.ndarray) -> option:
+    return option(o.S, o.K, o.T, o.v, o.r, o.q + x)
+
+# spot: relative move, vol/rate/dividend: absolute shift, time: days elapsed
+SHOCKS = { "spot"     : shock_spot        \
+         , "vol"      : shock_vol         \
+         , "time"     : shock_time        \
+         , "rate"     : shock_rate        \
+         , "dividend" : shock_dividend    }
+
+@dataclass
+class ScenarioResult:
+    """
+    Greeks over the cartesian product of the shock axes. Every array in
+    `greeks` has shape (*[len(x) for x in axes.values()], options), with
+    the axes in the order they were given.
+    """
+    axes: dict
+    greeks: dict
+
+    @property
+    def dims(self) -> tuple:
+        return tuple(self.axes) + ("option",)
+
+    def sel(self, **points) -> dict:
+        """
+        Slices every greek at the given axis values, e.g. sel(vol = 0.0).
+        """
+        index = []
+        for name, values in self.axes.items():
+            if name in points:
+                index.append(int(np.flatnonzero(np.isclose(values, points[name]))[0]))
+            else:
+                index.append(slice(None))
+        return {k: g[tuple(index)] for k, g in self.greeks.items()}
+
+def chunk_slices(length: int, size: int) -> list:
+    return [slice(i, min(i + size, length)) for i in range(0, length, size)]
+
+def axis_shape(position: int, ndim: int) -> tuple:
+    shape = [1] * (ndim + 1)
+    shape[position] = -1
+    return tuple(shape)
+
+def scenario_grid(o: option, 
+                  axes: dict, 
+                  which: tuple = ("delta", "gamma"), 
+                  notional: np.ndarray = None, 
+                  is_call = True, 
+                  memory_budget: int = DEFAULT_MEMORY_BUDGET, 
+                  backend: str = None, 
+                  precision: str = "float64") -> ScenarioResult:
+    """
+    Evaluates greeks over every combination of the named shock axes.
+
+    Each shock is reshaped to its own dimension and applied by
+    broadcasting, so inputs are never expanded to the grid size. The grid
+    is evaluated in blocks of options (and of the first axis when a single
+    option does not fit) so working memory stays under `memory_budget`
+    bytes; only the outputs are allocated at full size. With
+    `precision = "float32"` the outputs take half the memory.
+    """
+    unknown = set(axes) - set(SHOCKS)
+    if unknown:
+        raise ValueError("unknown shock axes: {:}, expected {:}".format(sorted(unknown), list(SHOCKS)))
+
+    axes = {name: np.atleast_1d(np.asarray(values, dtype = np.float64)) for name, values in axes.items()}
+    names = list(axes)
+    grid_shape = tuple(len(x) for x in axes.values())
+
+    # scalars count as a single option
+    columns = np.broadcast_arrays(o.S, o.K, o.T, o.v, o.r, o.q, is_call,
+                                  notional if notional is not None else 0.0)
+    S, K, T, v, r, q, is_call, notional_column = (np.atleast_1d(x) for x in columns)
+    n_options = np.shape(K)[-1]
+
+    outputs = list(which) + (["dollar_" + x for x in which] if notional is not None else [])
+    result = {name: np.empty(grid_shape + (n_options,), dtype = precision) for name in outputs}
+
+    cell_bytes = np.dtype(precision).itemsize * len(outputs) + 8 * WORKING_ARRAYS
+    cells_per_option = int(np.prod(grid_shape))
+    options_per_chunk = max(1, memory_budget // (cell_bytes * cells_per_option))
+
+    leading_rows = grid_shape[0] if names else 1
+    rows_per_chunk = leading_rows
+    if options_per_chunk == 1 and names:
+        rows_per_chunk = max(1, memory_budget // (cell_bytes * (cells_per_option // leading_rows)))
+
+    for option_slice in chunk_slices(n_options, options_per_chunk):
+        for row_slice in chunk_slices(leading_rows, rows_per_chunk):
+            chunk = option(S[..., option_slice], K[..., option_slice], T[..., option_slice], 
+                           v[..., option_slice], r[..., option_slice], q[..., option_slice])
+
+            for position, name in enumerate(names):
+                values = axes[name][row_slice] if position == 0 else axes[name]
+                chunk = SHOCKS[name](chunk, values.reshape(axis_shape(position, len(names))))
+
+            chunk_notional = notional_column[..., option_slice] if notional is not None else None
+            chunk_greeks = black_scholes.greeks(chunk, which, chunk_notional, is_call[..., option_slice], backend, precision)
+
+            index = (row_slice,) if names else ()
+            index = index + (Ellipsis, option_slice)
+            for name in outputs:
+                result[name][index] = chunk_greeks[name]
+
+    return ScenarioResult(axes, result)
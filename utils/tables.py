@@ -1,10 +1,25 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from utils.parallel import process_context
+
+# above this many cells the heatmap is drawn without the value annotations
+ANNOTATION_LIMIT = 2000
+# tables taller than this are aggregated by underlying, then paged
+MAX_ROWS = 60
 
 
-def plot_table(table: pd.DataFrame) -> plt.Axes:
+def plot_table(table: pd.DataFrame) -> Axes:
+    # seaborn draws through pyplot, both are only imported when a heatmap is
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize = (20, 10))
 
     color = sns.color_palette("vlag_r", as_cmap = True)
@@ -28,6 +43,95 @@ def plot_table(table: pd.DataFrame) -> plt.Axes:
 
     return axis
 
-def save_table_heatmap(heatmap: plt.Axes, where: os.path) -> None:
+def save_table_heatmap(heatmap: Axes, where: os.path) -> None:
     heatmap.get_figure().savefig(where)
     return
+
+def fits_annotated_heatmap(table: pd.DataFrame) -> bool:
+    return table.size <= ANNOTATION_LIMIT and len(table) <= MAX_ROWS
+
+def aggregate_by_underlying(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sums rows labelled "ativo-call_put-direction" per ativo.
+    """
+    underlying = [str(x).rsplit("-", 2)[0] for x in table.index]
+    aggregated = table.groupby(underlying, sort = False).sum()
+    aggregated.name = getattr(table, "name", None)
+    return aggregated
+
+def paginate(table: pd.DataFrame, max_rows: int) -> list:
+    return [table.iloc[i:i + max_rows] for i in range(0, len(table), max_rows)]
+
+def color_limits(values: np.ndarray) -> tuple:
+    # same limits seaborn uses for robust = True, center = 0
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return -1, 1
+    low, high = np.percentile(finite, [2, 98])
+    bound = max(abs(low), abs(high)) or 1
+    return -bound, bound
+
+def render_page(table: pd.DataFrame, where: str, annotate: bool, limits: tuple) -> str:
+    """
+    Draws one page with the Agg canvas directly (no pyplot state), with
+    the whole grid as a single image.
+    """
+    # only for the palette, the figure never goes through pyplot
+    import seaborn as sns
+
+    values = table.to_numpy(dtype = np.float64)
+    height = min(10, max(3, 0.25 * len(table) + 1.5))
+
+    figure = Figure(figsize = (20, height))
+    FigureCanvasAgg(figure)
+    axis = figure.add_subplot()
+
+    vmin, vmax = limits
+    color = sns.color_palette("vlag_r", as_cmap = True)
+    axis.imshow(values, cmap = color, vmin = vmin, vmax = vmax, aspect = "auto", interpolation = "nearest")
+
+    if annotate:
+        for (i, j), value in np.ndenumerate(values):
+            axis.text(j, i, "{:,.0f}".format(value), ha = "center", va = "center", size = 10)
+
+    axis.set_xticks(range(values.shape[1]))
+    axis.set_xticklabels(table.columns, fontweight = "bold", fontsize = 9)
+    axis.set_yticks(range(values.shape[0]))
+    axis.set_yticklabels(table.index)
+    axis.tick_params(axis = "x", length = 0, labeltop = True, labelbottom = False)
+    axis.tick_params(axis = "y", length = 0, labelsize = "x-small")
+
+    figure.savefig(where)
+    return where
+
+def render_table(table: pd.DataFrame, 
+                 where: str, 
+                 annotation_limit: int = ANNOTATION_LIMIT, 
+                 max_rows: int = MAX_ROWS) -> list:
+    """
+    Scalable heatmap for large tables. Rows are summed per underlying when
+    there are more than `max_rows`, and what is still too tall is split
+    into pages saved as <where>, <stem>_2<ext>, ... Cell annotations are
+    dropped past `annotation_limit` cells. Returns the written paths.
+    """
+    if len(table) > max_rows:
+        table = aggregate_by_underlying(table)
+
+    limits = color_limits(table.to_numpy(dtype = np.float64))
+    stem, extension = os.path.splitext(where)
+    paths = []
+    for number, page in enumerate(paginate(table, max_rows), start = 1):
+        path = where if number == 1 else "{:}_{:}{:}".format(stem, number, extension)
+        paths.append(render_page(page, path, page.size <= annotation_limit, limits))
+
+    return paths
+
+def render_tables(tables: list, paths: list, **kwargs) -> list:
+    """
+    Renders each table in its own process, so the delta and gamma
+    figures are drawn concurrently.
+    """
+    context = process_context(["utils.tables", "seaborn"])
+    with ProcessPoolExecutor(max_workers = len(tables), mp_context = context) as pool:
+        futures = [pool.submit(render_table, table, where, **kwargs) for table, where in zip(tables, paths)]
+        return [future.result() for future in futures]
@@ -0,0 +1,142 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import black_scholes
+from utils.book import OptionBook
+from utils.aggregate import reduce_by_code
+from utils.proxy import shocked_book
+from utils.scenarios import DEFAULT_MEMORY_BUDGET, WORKING_ARRAYS, chunk_slices
+
+DEFAULT_LEVEL = 0.99
+DEFAULT_HORIZON_DAYS = 1
+
+RETURNS_READERS = { ".csv"     : pd.read_csv        \
+                  , ".xlsx"    : pd.read_excel      \
+                  , ".pickle"  : pd.read_pickle     \
+                  , ".parquet" : pd.read_parquet    }
+
+def read_returns(file: str) -> pd.DataFrame:
+    """
+    Returns matrix with one row per date and one column per underlying
+    (`ativo`), holding relative spot moves. The first column is taken as
+    the date.
+    """
+    _, extension = os.path.splitext(file)
+    if extension not in RETURNS_READERS:
+        raise ValueError("cannot read returns from {:}, expected one of {:}".format(file, list(RETURNS_READERS)))
+
+    data = RETURNS_READERS[extension](file)
+    return data.set_index(data.columns[0])
+
+def returns_for_book(returns: pd.DataFrame, book: OptionBook) -> np.ndarray:
+    """
+    (dates, underlyings) float64 matrix with columns in `book.names` order,
+    so that column `book.codes[i]` is the return of option i's underlying.
+    """
+    names = [str(x) for x in book.names]
+    missing = sorted(set(names) - set(str(x) for x in returns.columns))
+    if missing:
+        raise ValueError("no returns for underlyings {:}".format(missing))
+
+    returns = returns.rename(columns = str)
+    return np.ascontiguousarray(returns[names].to_numpy(dtype = np.float64))
+
+def tail_scenarios(pnl: np.ndarray, level: float) -> np.ndarray:
+    """
+    Scenario numbers of the ceil((1 - level) n) largest losses, worst
+    first. The P&L vector holds one float per scenario, so a partition of
+    the whole of it is cheap; the per-option P&L is never kept.
+    """
+    count = max(1, int(np.ceil((1 - level) * len(pnl) - 1e-9)))
+    worst = np.argpartition(pnl, count - 1)[:count]
+    return worst[np.argsort(pnl[worst], kind = "stable")]
+
+@dataclass
+class VaRReport:
+    """
+    Historical simulation VaR and ES at `level` over `horizon_days`, as
+    positive losses in P&L units (notional times price).
+
+    `pnl` is the book P&L per scenario (date) and `by_underlying` the same
+    split per underlying, shape (dates, underlyings). `tail` lists the
+    scenarios averaged by ES, worst first. The contributions are the mean
+    P&L over those scenarios, so they add up to -es; `top_options` indexes
+    the book rows with the largest losses there.
+    """
+    level: float
+    horizon_days: int
+    var: float
+    es: float
+    pnl: np.ndarray
+    by_underlying: np.ndarray
+    tail: np.ndarray
+    underlying_contributions: np.ndarray
+    option_contributions: np.ndarray
+    top_options: np.ndarray
+
+def repriced_pnl(book: OptionBook,
+                 returns: np.ndarray,
+                 horizon_days: int,
+                 memory_budget: int,
+                 backend: str):
+    """
+    Yields (scenario rows, option columns, P&L block) for the book fully
+    repriced under every row of `returns`, in blocks that fit the budget.
+    """
+    n_scenarios, n_options = len(returns), len(book)
+    base = black_scholes.greeks(book, ("price",), book.notional, book.is_call, backend)["dollar_price"]
+
+    cell_bytes = 8 * WORKING_ARRAYS
+    options_per_chunk = max(1, min(n_options, memory_budget // cell_bytes))
+    rows_per_chunk = max(1, memory_budget // (cell_bytes * options_per_chunk))
+
+    for columns in chunk_slices(n_options, options_per_chunk):
+        part = OptionBook(*(getattr(book, name)[columns] for name in ("S", "K", "T", "v", "r", "q", "is_call",
+                                                                      "notional", "codes")),
+                          book.names, book.labels[columns])
+        for rows in chunk_slices(n_scenarios, rows_per_chunk):
+            x = returns[rows][:, part.codes]
+            shocked = shocked_book(part, x, 0.0, horizon_days)
+            value = black_scholes.greeks(shocked, ("price",), part.notional, part.is_call, backend)["dollar_price"]
+            yield rows, columns, value - base[columns]
+
+def historical_var(book: OptionBook,
+                   returns: np.ndarray,
+                   level: float = DEFAULT_LEVEL,
+                   horizon_days: int = DEFAULT_HORIZON_DAYS,
+                   top: int = 10,
+                   memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                   backend: str = None) -> VaRReport:
+    """
+    Applies every row of `returns` (from returns_for_book) to the spots of
+    the book, lets `horizon_days` pass and fully reprices. The first pass
+    keeps P&L per scenario and underlying only; the scenarios in the tail
+    are then repriced a second time to attribute the ES to single options.
+    """
+    n_scenarios, n_groups = len(returns), len(book.names)
+    by_underlying = np.zeros((n_scenarios, n_groups))
+    for rows, columns, block in repriced_pnl(book, returns, horizon_days, memory_budget, backend):
+        reduce_by_code(block, book.codes[columns], n_groups, by_underlying[rows])
+
+    pnl = by_underlying.sum(axis = 1)
+    tail = tail_scenarios(pnl, level)
+
+    option_contributions = np.zeros(len(book))
+    for _, columns, block in repriced_pnl(book, returns[tail], horizon_days, memory_budget, backend):
+        option_contributions[columns] += block.sum(axis = 0)
+    option_contributions /= len(tail)
+
+    top_options = np.argsort(option_contributions, kind = "stable")[:top]
+    return VaRReport( level                                         \
+                    , horizon_days                                  \
+                    , float(-pnl[tail[-1]])                         \
+                    , float(-pnl[tail].mean())                      \
+                    , pnl                                           \
+                    , by_underlying                                 \
+                    , tail                                          \
+                    , by_underlying[tail].mean(axis = 0)            \
+                    , option_contributions                          \
+                    , top_options                                   )
@@ -0,0 +1,132 @@
+import os
+import csv
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+class TableWriter(ABC):
+    """
+    Writes named tables (sheets) of option rows, one chunk of rows at a
+    time, so results can be written as they are priced. Each sheet is a
+    label column followed by one column per entry of `columns`, the
+    layout DataFrame.to_excel gives the greeks tables.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @abstractmethod
+    def add_sheet(self, name: str, columns: list) -> None:
+        ...
+
+    @abstractmethod
+    def write(self, name: str, labels, values: np.ndarray) -> None:
+        ...
+
+    def write_table(self, name: str, table) -> None:
+        self.add_sheet(name, list(table.columns))
+        self.write(name, table.index, table.to_numpy())
+
+    def close(self) -> None:
+        pass
+
+class ExcelWriter(TableWriter):
+    """
+    openpyxl write-only workbook: rows are flushed to per-sheet temporary
+    files as they arrive, memory does not grow with the row count.
+    """
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+
+        TableWriter.__init__(self, path)
+        self.workbook = Workbook(write_only = True)
+        self.sheets = dict()
+
+    def add_sheet(self, name: str, columns: list) -> None:
+        sheet = self.workbook.create_sheet(title = name)
+        sheet.append([None] + list(columns))
+        self.sheets[name] = sheet
+
+    def write(self, name: str, labels, values: np.ndarray) -> None:
+        sheet = self.sheets[name]
+        for label, row in zip(labels, np.asarray(values, dtype = np.float64).tolist()):
+            sheet.append([label] + [None if x != x else x for x in row])
+
+    def close(self) -> None:
+        self.workbook.save(self.path)
+
+class CsvWriter(TableWriter):
+    """
+    One CSV per sheet, <stem>_<sheet>.csv next to `path`.
+    """
+    def __init__(self, path: str):
+        TableWriter.__init__(self, path)
+        self.files = dict()
+        self.writers = dict()
+
+    def sheet_path(self, name: str) -> str:
+        stem, _ = os.path.splitext(self.path)
+        return "{:}_{:}.csv".format(stem, name.lower())
+
+    def add_sheet(self, name: str, columns: list) -> None:
+        self.files[name] = open(self.sheet_path(name), "w", newline = "")
+        self.writers[name] = csv.writer(self.files[name])
+        self.writers[name].writerow([""] + list(columns))
+
+    def write(self, name: str, labels, values: np.ndarray) -> None:
+        self.writers[name].writerows([label] + row for label, row in 
+                                     zip(labels, np.asarray(values, dtype = np.float64).tolist()))
+
+    def close(self) -> None:
+        for handle in self.files.values():
+            handle.close()
+
+class ParquetWriter(TableWriter):
+    """
+    One Parquet file per sheet, <stem>_<sheet>.parquet, with a row group
+    per written chunk. The labels go in an "option" column.
+    """
+    def __init__(self, path: str):
+        from utils.data_handling import import_pyarrow
+
+        TableWriter.__init__(self, path)
+        self.pyarrow = import_pyarrow()
+        import pyarrow.parquet
+
+        self.writers = dict()
+        self.columns = dict()
+
+    def sheet_path(self, name: str) -> str:
+        stem, _ = os.path.splitext(self.path)
+        return "{:}_{:}.parquet".format(stem, name.lower())
+
+    def add_sheet(self, name: str, columns: list) -> None:
+        pa = self.pyarrow
+        self.columns[name] = [str(x) for x in columns]
+        schema = pa.schema([("option", pa.string())] + [(x, pa.float64()) for x in self.columns[name]])
+        self.writers[name] = pa.parquet.ParquetWriter(self.sheet_path(name), schema)
+
+    def write(self, name: str, labels, values: np.ndarray) -> None:
+        pa = self.pyarrow
+        values = np.asarray(values, dtype = np.float64)
+        arrays = [pa.array(np.asarray(labels).astype(str))] + [pa.array(values[:, i]) for i in range(values.shape[1])]
+        self.writers[name].write_table(pa.Table.from_arrays(arrays, names = ["option"] + self.columns[name]))
+
+    def close(self) -> None:
+        for writer in self.writers.values():
+            writer.close()
+
+WRITERS = { ".xlsx"    : ExcelWriter     \
+          , ".csv"     : CsvWriter       \
+          , ".parquet" : ParquetWriter   }
+
+def open_writer(path: str) -> TableWriter:
+    _, extension = os.path.splitext(path)
+    if extension not in WRITERS:
+        raise ValueError("no writer for {:}, expected one of {:}".format(path, list(WRITERS)))
+    return WRITERS[extension](path)